@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Compare config hashing: the former freeze + md5 hash, the canonical json +
+blake2b hash, and HashTree re-hashing a config after one key changed. The
+last cases write one key of a json file project, reload it and build the
+snapshot, with and without the previous snapshot to reuse key hashes of.
+
+    python benchmarks/hash_benchmark.py --keys 2000 --number 20
+"""
+import sys
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+from rtconfig.backend import JsonFileBackend
+from rtconfig.helpers import LRUCache
+from rtconfig.manager import ConfigProject, ENV_DOMAIN
+from rtconfig.snapshot import SnapshotStore
+from rtconfig.utils import freeze, to_hash, HashTree
+
+
+def legacy_hash(*sub, **kw):
+    content = str(freeze([sub, kw])).encode('utf-8', 'ignore')
+    return hashlib.md5(content).hexdigest()[8:-8]
+
+
+def make_config(keys):
+    random.seed(keys)
+    data = {}
+    for i in range(keys):
+        kind = i % 4
+        if kind == 0:
+            value = 'value-%s-{HOST}' % random.random()
+        elif kind == 1:
+            value = random.randint(0, 1 << 30)
+        elif kind == 2:
+            value = [random.random() for _ in range(8)]
+        else:
+            value = {'host': '127.0.0.%s' % (i % 255), 'port': 8000 + i,
+                     'options': {'timeout': 5, 'retry': [1, 2, 4]}}
+        data['KEY_%05d' % i] = value
+    return data
+
+
+def write_reload_snapshot(data, history_size):
+    backend = JsonFileBackend(tempfile.mkdtemp(), project_cache=LRUCache(64))
+    items = {key: {'key': key, 'value': value, 'desc': ''} for key, value in data.items()}
+    backend.save('app', dict(ENV_DOMAIN, default=items))
+    snapshots = SnapshotStore(history_size=history_size)
+    counter = [0]
+
+    def snapshot():
+        project = ConfigProject('app', backend, snapshots=snapshots)
+        with project.use_env('default'):
+            return project.get_snapshot()
+
+    def write_reload():
+        counter[0] += 1
+        backend.update_keys('app', [('default', 'KEY_00000', {
+            'key': 'KEY_00000', 'value': counter[0], 'desc': ''})])
+        backend.mark_changed('app')
+        snapshots.invalidate('app')
+        return snapshot()
+    snapshot()
+    return write_reload
+
+
+def bench(func, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) * 1000 / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Config hash benchmark.')
+    parser.add_argument('--keys', type=int, default=2000, help='config keys')
+    parser.add_argument('--number', type=int, default=20, help='rounds of every case')
+    options = parser.parse_args()
+
+    data = make_config(options.keys)
+    tree = HashTree(data)
+    changed = dict(data, KEY_00000='changed')
+
+    results = [
+        ('freeze + md5 (before)', bench(lambda: legacy_hash(data), options.number)),
+        ('canonical json + blake2b', bench(lambda: to_hash(data), options.number)),
+        ('HashTree full', bench(lambda: HashTree(data), options.number)),
+        ('HashTree one key changed', bench(lambda: HashTree(changed, tree), options.number)),
+        ('write + reload, full hash', bench(write_reload_snapshot(data, 0), options.number)),
+        ('write + reload, reuse hash', bench(write_reload_snapshot(data, 8), options.number)),
+    ]
+    sys.stdout.write('%s keys, %s rounds\n' % (options.keys, options.number))
+    for name, cost in results:
+        sys.stdout.write('%-28s %10.3f ms\n' % (name, cost))
+
+
+if __name__ == '__main__':
+    main()
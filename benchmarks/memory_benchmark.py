@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Compare memory of resolved env data kept for many clients: the former
+deepcopy of source data with in place rendering, and the frozen copy on
+write trees of ConfigProject.get_env_data sharing unchanged values with
+the cached documents.
+
+    python benchmarks/memory_benchmark.py --keys 2000 --contexts 100
+"""
+import sys
+import copy
+import time
+import argparse
+import tempfile
+import tracemalloc
+from rtconfig.backend import JsonFileBackend
+from rtconfig.helpers import LRUCache
+from rtconfig.manager import ConfigProject, ENV_DOMAIN
+
+
+def legacy_format_env_data(env_data, **variable):
+    class SafeDict(dict):
+        def __missing__(self, key):
+            return '{' + key + '}'
+
+    def _convert(data):
+        if isinstance(data, dict):
+            for key, value in data.items():
+                data[key] = _convert(value)
+        elif isinstance(data, list):
+            for idx, value in enumerate(data):
+                data[idx] = _convert(value)
+        elif isinstance(data, str):
+            data = data.format_map(SafeDict(**variable))
+        return data
+    return _convert(env_data)
+
+
+def legacy_get_env_data(project):
+    env_data, env_var = {}, {}
+    source = copy.deepcopy(project.source_data)
+    for parent in source.get('parent') or []:
+        parent_project = ConfigProject(parent, project.store_backend)
+        with parent_project.use_env(env=project.env, context=project.context):
+            env_data.update(legacy_get_env_data(parent_project))
+            env_var.update(parent_project.get_env_kv_data(
+                parent_project.source_data, 'environ'))
+    for env in ['default', project.env]:
+        env_data.update(project.get_env_kv_data(source, env))
+    env_var.update(project.get_env_kv_data(source, 'environ'))
+    env_var.update(project.get_context_variables(env_var))
+    return legacy_format_env_data(env_data, **env_var)
+
+
+def make_items(keys, prefix):
+    items = {}
+    for i in range(keys):
+        if i % 50 == 0:
+            value = 'http://{HOST}:{PORT}/%s/%s' % (prefix, i)
+        elif i % 2:
+            value = ['%s-item-%s' % (prefix, i), 'plain text value %s' % i, i]
+        else:
+            value = {'name': '%s-service-%s' % (prefix, i), 'path': '/data/%s' % i,
+                     'options': {'timeout': 5, 'retry': [1, 2, 4]}}
+        key = '%s_%05d' % (prefix.upper(), i)
+        items[key] = {'key': key, 'value': value, 'desc': ''}
+    return items
+
+
+def make_backend(keys):
+    backend = JsonFileBackend(tempfile.mkdtemp(), project_cache=LRUCache(64))
+    environ = {k: {'key': k, 'value': v, 'desc': ''}
+               for k, v in [('HOST', '127.0.0.1'), ('PORT', 8080)]}
+    backend.save('base', dict(copy.deepcopy(ENV_DOMAIN), environ=environ,
+                              default=make_items(keys // 2, 'base')))
+    backend.save('app', dict(copy.deepcopy(ENV_DOMAIN), parent=['base'],
+                             default=make_items(keys // 2, 'app')))
+    return backend
+
+
+def bench(func, project, contexts):
+    project.source_data  # warm up project cache
+    tracemalloc.start()
+    start = time.perf_counter()
+    retained = []
+    for i in range(contexts):
+        with project.use_env('default', {'environ': {'HOST': 'host-%s' % i}}):
+            retained.append(func(project))
+    cost = (time.perf_counter() - start) * 1000 / contexts
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / 1024 / 1024, cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolved config memory benchmark.')
+    parser.add_argument('--keys', type=int, default=2000, help='config keys')
+    parser.add_argument('--contexts', type=int, default=100, help='resolved configs kept')
+    options = parser.parse_args()
+
+    project = ConfigProject('app', make_backend(options.keys))
+    with project.use_env('default', {'environ': {'HOST': 'x'}}):
+        assert legacy_get_env_data(project) == project.get_env_data()
+    results = [
+        ('deepcopy + format_map (before)', bench(legacy_get_env_data, project, options.contexts)),
+        ('copy on write', bench(ConfigProject.get_env_data, project, options.contexts)),
+    ]
+    sys.stdout.write('%s keys, %s contexts\n' % (options.keys, options.contexts))
+    for name, (memory, cost) in results:
+        sys.stdout.write('%-32s %10.2f MiB %10.3f ms\n' % (name, memory, cost))
+
+
+if __name__ == '__main__':
+    main()
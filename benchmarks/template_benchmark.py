@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Compare rendering env data: the former format_map of every string with a
+new SafeDict, and the compiled templates of format_env_data.
+
+    python benchmarks/template_benchmark.py --keys 2000 --number 20
+"""
+import sys
+import copy
+import time
+import argparse
+from rtconfig.utils import format_env_data
+
+
+def legacy_format_env_data(env_data, **variable):
+    class SafeDict(dict):
+        def __missing__(self, key):
+            return '{' + key + '}'
+
+    def _convert(data):
+        if isinstance(data, dict):
+            for key, value in data.items():
+                data[key] = _convert(value)
+        elif isinstance(data, list):
+            for idx, value in enumerate(data):
+                data[idx] = _convert(value)
+        elif isinstance(data, str):
+            data = data.format_map(SafeDict(**variable))
+        return data
+    return _convert(env_data)
+
+
+def make_config(keys):
+    data = {}
+    for i in range(keys):
+        if i % 10 == 0:
+            value = 'http://{HOST}:{PORT}/api/%s' % i
+        elif i % 2:
+            value = ['item-%s' % i, 'plain text value %s' % i, i]
+        else:
+            value = {'name': 'service-%s' % i, 'path': '/data/%s' % i, 'flag': True}
+        data['KEY_%05d' % i] = value
+    return data
+
+
+def bench(func, data, variables, number):
+    copies = [copy.deepcopy(data) for _ in range(number)]
+    start = time.perf_counter()
+    for item in copies:
+        func(item, **variables)
+    return (time.perf_counter() - start) * 1000 / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Config template benchmark.')
+    parser.add_argument('--keys', type=int, default=2000, help='config keys')
+    parser.add_argument('--number', type=int, default=20, help='rounds of every case')
+    options = parser.parse_args()
+
+    data = make_config(options.keys)
+    variables = {'HOST': '127.0.0.1', 'PORT': 8080, 'UNUSED': 'x'}
+    assert legacy_format_env_data(copy.deepcopy(data), **variables) == \
+        format_env_data(copy.deepcopy(data), **variables)
+    results = [
+        ('format_map (before)', bench(legacy_format_env_data, data, variables, options.number)),
+        ('compiled templates', bench(format_env_data, data, variables, options.number)),
+    ]
+    sys.stdout.write('%s keys, %s rounds\n' % (options.keys, options.number))
+    for name, cost in results:
+        sys.stdout.write('%-28s %10.3f ms\n' % (name, cost))
+
+
+if __name__ == '__main__':
+    main()
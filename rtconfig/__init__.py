@@ -11,7 +11,8 @@ except ImportError:
     pass
 
 from rtconfig.exceptions import GlobalApiException, BaseConfigException, ConnectException
-from rtconfig.message import Message
+from rtconfig.message import Message, FEATURE_CONTEXT, MT_UNSUBSCRIBE
+from rtconfig.connection import ClientSession
 from rtconfig.client import RtConfigClient
 
 __version__ = '0.1.8'
@@ -37,6 +38,7 @@ class RtConfig:
         @self.app.request_middleware
         async def process_request(request):
             request.config_manager = self.config_manager
+            await self.config_manager.start_cluster()
 
         @app.route('/')
         async def index(request):
@@ -50,7 +52,10 @@ class RtConfig:
         @app.websocket('/connect')
         async def client_connect(request, ws):
             config_project, received_message = None, None
+            session = ClientSession()
+            await self.config_manager.start_cluster()
             while True:
+                received_message = None
                 try:
                     if request.app.config.get('OPEN_CLIENT_AUTH_TOKEN'):
                         authorization_token = request.headers.get('authorization_token')
@@ -63,13 +68,22 @@ class RtConfig:
                         request.user = auth_manager.load_user(user)
 
                     received_message = Message(request=request, **json.loads(await ws.recv()))
-                    config_project = self.config_manager.get_config_project(
+                    session.resolve(received_message)
+                    if received_message.message_type == MT_UNSUBSCRIBE:
+                        await self.config_manager.remove_subscription(ws, received_message)
+                        continue
+                    config_project = await self.config_manager.load_config_project(
                         received_message.config_name, check_exist=True)
                     await self.config_manager.add_connection(ws, received_message)
-                    await ws.send(config_project.config_message(received_message))
+                    options = session.get_options(
+                        received_message.config_name, config_project.environ_keys()) \
+                        if received_message.support(FEATURE_CONTEXT) else None
+                    await ws.send(config_project.config_message(
+                        received_message, compressor=self.config_manager.compressor,
+                        options=options))
                 except BaseConfigException as ex:
                     self.config_manager.logger.exception(str(ex))
-                    await ws.send(ex.get_message())
+                    await ws.send(ex.get_message(received_message))
                 except (asyncio.CancelledError, websockets.ConnectionClosed) as ex:
                     if config_project:
                         await self.config_manager.remove_connection(ws, received_message)
@@ -5,8 +5,9 @@ import uuid
 import hashlib
 import logging
 from datetime import datetime
-from urllib.parse import urlparse
 from rtconfig.utils import OSUtils, strftime
+from rtconfig.backend import get_redis_pool, get_mongo_database, ensure_mongo_index, \
+    get_sqlite_connection, sqlite_transaction
 from rtconfig.exceptions import GlobalApiException
 from alita_login import UserMixin, AnonymousUserMixin
 try:
@@ -18,7 +19,6 @@ except:
 
 try:
     import pymongo
-    import pymongo.uri_parser
     mongodb_usable = True
 except:
     mongodb_usable = False
@@ -153,20 +153,21 @@ class RedisAuthManager(AuthManager):
     def __init__(self, app):
         super().__init__(app)
         self.redis_url = self.app.config['REDIS_URL']
+        self._redis_client = None
         if not redis_usable:
             raise RuntimeError('You need install [redis] package.')
         self.init_admin()
 
     @property
     def redis_client(self):
-        logger.debug("Creating Redis connection (%s)", self.redis_url)
-        redis_conf = urlparse(self.redis_url)
-        db = redis_conf.path[1] if redis_conf.path else 0
-        return redis.StrictRedis(
-            host=redis_conf.hostname,
-            port=redis_conf.port, db=db,
-            password=redis_conf.password
-        )
+        if self._redis_client is None:
+            self._redis_client = redis.StrictRedis(connection_pool=get_redis_pool(
+                self.redis_url,
+                max_connections=self.app.config.get('REDIS_MAX_CONNECTIONS', 50),
+                socket_timeout=self.app.config.get('REDIS_SOCKET_TIMEOUT', 5),
+                health_check_interval=self.app.config.get('REDIS_HEALTH_CHECK_INTERVAL', 30)
+            ))
+        return self._redis_client
 
     def get_all(self):
         return {k.decode(self.__charset__): json.loads(v.decode(self.__charset__))
@@ -184,14 +185,13 @@ class MongodbAuthManager(AuthManager):
         self.mongodb_url = self.app.config['MONGODB_URL']
         if not mongodb_usable:
             raise RuntimeError('You need install [pymongo] package.')
+        ensure_mongo_index(self.db_client[self._auth_data_scope], 'username')
         self.init_admin()
 
     @property
     def db_client(self):
-        logger.debug("Creating Mongodb connection (%s)", self.mongodb_url)
-        res = pymongo.uri_parser.parse_uri(self.mongodb_url, warn=True)
-        db_connection = pymongo.MongoClient(self.mongodb_url)
-        return db_connection[res["database"]]
+        return get_mongo_database(
+            self.mongodb_url, self.app.config.get('MONGODB_MAX_POOL_SIZE', 100))
 
     def get_all(self):
         return {i['username']: i for i in self.db_client[self._auth_data_scope].find()}
@@ -210,9 +210,45 @@ class MongodbAuthManager(AuthManager):
         self.db_client[self._auth_data_scope].remove({'username': username})
 
 
+class SqliteAuthManager(AuthManager):
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.sqlite_path = os.path.abspath(
+            os.path.expanduser(self.app.config['SQLITE_PATH']))
+        directory = os.path.dirname(self.sqlite_path)
+        if not self.os_util.directory_exists(directory):
+            self.os_util.makedirs(directory)
+        self.db_client.execute(
+            'CREATE TABLE IF NOT EXISTS %s (username TEXT PRIMARY KEY, data TEXT NOT NULL)'
+            % self._auth_data_scope)
+        self.init_admin()
+
+    @property
+    def db_client(self):
+        return get_sqlite_connection(self.sqlite_path)
+
+    def get_all(self):
+        return {username: json.loads(data) for username, data in self.db_client.execute(
+            'SELECT username, data FROM %s' % self._auth_data_scope)}
+
+    def save_all(self, all_user):
+        with sqlite_transaction(self.db_client) as conn:
+            conn.executemany(
+                'INSERT INTO %s (username, data) VALUES (?, ?) '
+                'ON CONFLICT (username) DO UPDATE SET data = excluded.data'
+                % self._auth_data_scope,
+                [(k, json.dumps(v)) for k, v in all_user.items()])
+
+    def delete_user(self, username):
+        self.db_client.execute(
+            'DELETE FROM %s WHERE username = ?' % self._auth_data_scope, (username,))
+
+
 __all__ = [
     'AuthManager',
     'FileAuthManager',
     'RedisAuthManager',
-    'MongodbAuthManager'
+    'MongodbAuthManager',
+    'SqliteAuthManager'
 ]
@@ -4,11 +4,17 @@ import json
 import time
 import asyncio
 import logging
+import sqlite3
 import datetime
+import tempfile
+import functools
 import threading
-from urllib.parse import urlparse
-from rtconfig.exceptions import ProjectNoFoundException
+import contextlib
+from rtconfig.exceptions import ProjectNoFoundException, ConfigVersionException
+from rtconfig.helpers import LRUCache
+from rtconfig.frozen import freeze_data
 from rtconfig.utils import OSUtils, object_merge, strftime
+from rtconfig.bus import RedisChangeBus, MongodbChangeBus, UnixSocketChangeBus
 
 try:
     import redis
@@ -17,8 +23,15 @@ except:
     redis_usable = False
 
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
 try:
     import pymongo
+    import pymongo.errors
     import pymongo.uri_parser
     mongodb_usable = True
 except:
@@ -27,6 +40,10 @@ except:
 
 logger = logging.getLogger(__name__)
 default_backends = {}
+_redis_pools = {}
+_mongo_clients = {}
+_sqlite_local = threading.local()
+_pool_lock = threading.Lock()
 __all__ = ["BaseBackend"]
 type_map = {
     'string': str,
@@ -36,39 +53,336 @@ type_map = {
 }
 
 
+def get_redis_pool(redis_url, max_connections=None, socket_timeout=None,
+                   health_check_interval=None):
+    """
+    Return the connection pool shared by all redis clients of redis_url.
+    """
+    with _pool_lock:
+        pool = _redis_pools.get(redis_url)
+        if pool is None:
+            logger.debug("Creating Redis connection pool (%s)", redis_url)
+            options = dict(
+                max_connections=max_connections or None,
+                socket_timeout=socket_timeout or None,
+                socket_connect_timeout=socket_timeout or None,
+            )
+            if health_check_interval:
+                options['health_check_interval'] = health_check_interval
+            pool = _redis_pools[redis_url] = redis.ConnectionPool.from_url(
+                redis_url, **options)
+        return pool
+
+
+def redis_pool_stats(pool):
+    return dict(
+        created=getattr(pool, '_created_connections', 0),
+        available=len(getattr(pool, '_available_connections', ())),
+        in_use=len(getattr(pool, '_in_use_connections', ())),
+        max=getattr(pool, 'max_connections', None),
+    )
+
+
+def get_mongo_database(mongodb_url, max_pool_size=None):
+    """
+    Return database of the MongoClient shared by all users of mongodb_url.
+    """
+    with _pool_lock:
+        try:
+            client, database = _mongo_clients[mongodb_url]
+        except KeyError:
+            logger.debug("Creating Mongodb client (%s)", mongodb_url)
+            options = {'maxPoolSize': max_pool_size} if max_pool_size else {}
+            client = pymongo.MongoClient(mongodb_url, **options)
+            database = pymongo.uri_parser.parse_uri(mongodb_url, warn=True)["database"]
+            _mongo_clients[mongodb_url] = client, database
+    return client[database]
+
+
+def ensure_mongo_index(collection, key, unique=True):
+    try:
+        collection.create_index(key, unique=unique, background=True)
+    except pymongo.errors.PyMongoError as ex:
+        logger.warning("Create Mongodb index %s.%s failed: %s",
+                       collection.name, key, str(ex))
+
+
+def get_sqlite_connection(sqlite_path):
+    """
+    Return the sqlite connection of current thread, connections are not
+    shared between threads and are opened in WAL mode.
+    """
+    connections = _sqlite_local.__dict__.setdefault('connections', {})
+    conn = connections.get(sqlite_path)
+    if conn is None:
+        conn = sqlite3.connect(sqlite_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        connections[sqlite_path] = conn
+    return conn
+
+
+@contextlib.contextmanager
+def sqlite_transaction(conn):
+    """
+    Write transaction taking the database write lock up front.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def apply_key_changes(source_data, changes):
+    for env, key, item in changes:
+        env_data = source_data.setdefault(env, {})
+        if item is None:
+            env_data.pop(key, None)
+        else:
+            env_data[key] = item
+
+
+def page_history(records, env=None, key=None, page=1, limit=10):
+    records = [r for r in records if (env is None or r.get('env') == env)
+               and (key is None or r.get('key') == key)]
+    return len(records), records[(page - 1) * limit: page * limit]
+
+
 class BaseBackend:
     __charset__ = "utf-8"
     __visit_name__ = 'base'
 
-    def __init__(self, loop=None, notify_callback=None, open_notify=True):
+    def __init__(self, loop=None, notify_callback=None, open_notify=True, project_cache=None,
+                 executor=None, history_max_records=1000, cluster_mode=False):
         self.loop = loop
         self.open_notify = open_notify
         self.notify_callback = notify_callback
+        self.project_cache = project_cache
+        self.executor = executor
+        self.history_max_records = history_max_records
+        self.cluster_mode = cluster_mode
+        self.change_bus = None
+        self._revisions = {}
+        self._project_locks = {}
 
     @classmethod
     def configuration_schema(cls):
-        return {}
+        return {
+            'history_max_records': {
+                'required': False,
+                'type': 'int',
+                'desc': '历史记录保留条数',
+                'default': 1000
+            },
+            'cluster_mode': {
+                'required': False,
+                'type': 'bool',
+                'desc': '集群模式',
+                'default': False
+            }
+        }
 
     def read(self, config_name, default=None, check_exist=False):
         raise NotImplementedError
 
-    async def write(self, config_name, data, merge=False):
+    def save(self, config_name, data, merge=False, expected_version=None):
+        """
+        Write the whole document and return its new version.
+        """
         raise NotImplementedError
 
-    async def delete(self, config_name):
+    def remove(self, config_name):
         raise NotImplementedError
 
     def iter_backend(self):
         raise NotImplementedError
 
+    def append_history(self, config_name, records):
+        raise NotImplementedError
+
+    def query_history(self, config_name, env=None, key=None, page=1, limit=10):
+        """
+        Return count and one page of matched history records, newest first.
+        """
+        raise NotImplementedError
+
+    def remove_history(self, config_name):
+        raise NotImplementedError
+
+    @staticmethod
+    def next_version(config_name, source_data, expected_version=None):
+        """
+        Check the stored version of project against expected version of
+        writer (compare and set), return the version of the new document.
+        """
+        version = (source_data or {}).get('version') or 0
+        if expected_version is not None and int(expected_version) != version:
+            raise ConfigVersionException(config_name=config_name)
+        return version + 1
+
+    def update_keys(self, config_name, changes, expected_version=None):
+        """
+        Apply env key changes of project in one transaction, changes are
+        (env, key, item) tuples and None item removes the key. Backends
+        override it to write only the changed keys. Return new version.
+        """
+        source_data = self.read(config_name, check_exist=True)
+        source_data = dict(source_data, **{
+            env: dict(source_data.get(env) or {}) for env, _, _ in changes})
+        apply_key_changes(source_data, changes)
+        return self.save(config_name, source_data, expected_version=expected_version)
+
+    def save_keys(self, config_name, env, items, expected_version=None):
+        return self.update_keys(config_name, [(env, key, item) for key, item in items.items()],
+                                expected_version)
+
+    def remove_keys(self, config_name, env, keys, expected_version=None):
+        return self.update_keys(config_name, [(env, key, None) for key in keys],
+                                expected_version)
+
+    async def run_sync(self, func, *args, **kwargs):
+        """
+        Run blocking store call in the io executor, keep event loop free.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs))
+
+    async def aread(self, config_name, default=None, check_exist=False):
+        return await self.run_sync(self.load, config_name, default, check_exist)
+
+    def project_lock(self, config_name):
+        """
+        Asyncio lock serializing writes of one project in this process.
+        """
+        lock = self._project_locks.get(config_name)
+        if lock is None:
+            lock = self._project_locks[config_name] = asyncio.Lock()
+        return lock
+
+    async def awrite(self, config_name, data, merge=False, expected_version=None):
+        async with self.project_lock(config_name):
+            version = await self.run_sync(self.save, config_name, data, merge, expected_version)
+            self.mark_changed(config_name)
+        await self.publish('callback_config_changed', config_name)
+        return version
+
+    async def adelete(self, config_name):
+        async with self.project_lock(config_name):
+            await self.run_sync(self.remove, config_name)
+            await self.run_sync(self.remove_history, config_name)
+            self.mark_changed(config_name)
+        await self.publish('callback_config_changed', config_name)
+
+    async def aupdate_keys(self, config_name, changes, expected_version=None):
+        async with self.project_lock(config_name):
+            version = await self.run_sync(
+                self.update_keys, config_name, changes, expected_version)
+            self.mark_changed(config_name)
+        await self.publish('callback_config_changed', config_name)
+        return version
+
+    async def awrite_keys(self, config_name, env, items, expected_version=None):
+        return await self.aupdate_keys(
+            config_name, [(env, key, item) for key, item in items.items()], expected_version)
+
+    async def adelete_keys(self, config_name, env, keys, expected_version=None):
+        return await self.aupdate_keys(
+            config_name, [(env, key, None) for key in keys], expected_version)
+
+    async def aiter_backend(self):
+        for config in await self.run_sync(lambda: list(self.iter_backend())):
+            yield config
+
+    async def aappend_history(self, config_name, records):
+        if records:
+            await self.run_sync(self.append_history, config_name, records)
+
+    async def aquery_history(self, config_name, env=None, key=None, page=1, limit=10):
+        return await self.run_sync(self.query_history, config_name, env, key, page, limit)
+
+    async def write(self, config_name, data, merge=False, expected_version=None):
+        return await self.awrite(config_name, data, merge, expected_version)
+
+    async def delete(self, config_name):
+        await self.adelete(config_name)
+
+    def last_modified(self, config_name):
+        return None
+
+    def signature(self, config_name):
+        """
+        Cheap token of the stored document changed by every write, also by
+        writers outside this process, 0 if project not exist. None if the
+        store can not tell, the cache then follows changes of this process.
+        """
+        return None
+
+    def revision(self, config_name):
+        """
+        Count of changes seen by this process, invalidates the project cache.
+        """
+        return self._revisions.get(config_name, 0)
+
+    def mark_changed(self, config_name):
+        self._revisions[config_name] = self.revision(config_name) + 1
+
+    def load(self, config_name, default=None, check_exist=False):
+        """
+        Read project data through the shared project cache, a cached
+        document is used while revision and stored signature are the same.
+        The document is frozen and shared between callers, values equal to
+        the outdated document are taken from it.
+        """
+        if self.project_cache is None:
+            return self.read(config_name, default=default, check_exist=check_exist)
+        revision, signature = self.revision(config_name), self.signature(config_name)
+        cached = self.project_cache.get(
+            config_name, check=lambda item: item[:2] == (revision, signature))
+        if cached is not None:
+            return cached[2]
+        outdated = self.project_cache.pop(config_name)
+        source_data = self.read(config_name, check_exist=check_exist)
+        if not source_data:
+            return default if default is not None else source_data
+        source_data = freeze_data(source_data, outdated[2] if outdated else None)
+        if revision == self.revision(config_name):
+            self.project_cache.set(config_name, (revision, signature, source_data))
+        return source_data
+
+    def create_change_bus(self):
+        raise NotImplementedError
+
+    def start_change_bus(self):
+        """
+        Start listening changes made by other server nodes, must be called
+        in the running server loop, return True if started by this call.
+        """
+        if not (self.cluster_mode and self.open_notify) or self.change_bus is not None:
+            return False
+        self.change_bus = self.create_change_bus()
+        self.change_bus.start(asyncio.get_event_loop(), self.notify_callback)
+        logger.info('Cluster change bus %s started, node: %s.',
+                    self.change_bus.__class__.__name__, self.change_bus.node_id)
+        return True
+
     async def publish(self, callback_func, *args, **kwargs):
         if not (self.open_notify and self.notify_callback):
             return
-        await self.notify_callback(json.dumps(dict(
+        message = json.dumps(dict(
             func=callback_func,
             args=list(args),
             kwargs=kwargs
-        )))
+        ))
+        if self.change_bus is not None:
+            try:
+                await self.run_sync(self.change_bus.publish, message)
+            except Exception as ex:
+                logger.error('Publish change to cluster failed: %s', str(ex))
+        await self.notify_callback(message)
 
     @classmethod
     def validate_options(cls, app_config, **kwargs):
@@ -90,8 +404,11 @@ class BaseBackend:
         return options
 
     def description(self):
-        return {schema.get('desc', key): getattr(self, key, '--')
-                for key, schema in self.configuration_schema().items()}
+        description = {schema.get('desc', key): getattr(self, key, '--')
+                       for key, schema in self.configuration_schema().items()}
+        if self.change_bus is not None:
+            description.update(self.change_bus.description())
+        return description
 
     def __init_subclass__(cls, **kwargs):
         __all__.append(cls.__name__)
@@ -107,52 +424,155 @@ class JsonFileBackend(BaseBackend):
     _extension = '.json'
     __visit_name__ = 'json_file'
 
+    _history_directory = 'history'
+    _history_extension = '.jsonl'
+
+    _lock_directory = '.lock'
+
     @classmethod
     def configuration_schema(cls):
-        return {
+        return dict(super().configuration_schema(), **{
             'config_store_directory': {
                 'required': False,
                 'type': 'string',
                 'desc': '数据存储目录',
                 'default': '~/config/data'
+            },
+            'config_store_fsync': {
+                'required': False,
+                'type': 'bool',
+                'desc': '写入后同步磁盘',
+                'default': False
             }
-        }
+        })
 
-    def __init__(self, config_store_directory, loop=None, notify_callback=None):
-        super().__init__(loop, notify_callback)
+    def __init__(self, config_store_directory, loop=None, notify_callback=None,
+                 project_cache=None, executor=None, history_max_records=1000,
+                 cluster_mode=False, config_store_fsync=False):
+        super().__init__(loop, notify_callback, project_cache=project_cache,
+                         executor=executor, history_max_records=history_max_records,
+                         cluster_mode=cluster_mode)
         self.config_store_directory = os.path.abspath(
             os.path.expanduser(config_store_directory))
+        self.history_directory = os.path.join(
+            self.config_store_directory, self._history_directory)
+        self.lock_directory = os.path.join(
+            self.config_store_directory, self._lock_directory)
+        self.config_store_fsync = config_store_fsync
         self.os_util = OSUtils()
+        self._history_lock = threading.Lock()
+        self._history_lines = {}
+        self._parsed = LRUCache(1024)
 
-        if not self.os_util.directory_exists(self.config_store_directory):
-            self.os_util.makedirs(self.config_store_directory)
+        for directory in [self.config_store_directory, self.history_directory,
+                          self.lock_directory]:
+            if not self.os_util.directory_exists(directory):
+                self.os_util.makedirs(directory)
 
     def get_file_path(self, config_name):
         file_name = config_name + self._extension
         return os.path.join(self.config_store_directory, file_name)
 
+    def last_modified(self, config_name):
+        try:
+            return datetime.datetime.fromtimestamp(
+                self.os_util.mtime(self.get_file_path(config_name)))
+        except OSError:
+            return None
+
+    @contextlib.contextmanager
+    def file_lock(self, config_name):
+        """
+        Advisory lock of project shared by server processes of the host.
+        """
+        if fcntl is None:
+            yield
+            return
+        lock_path = os.path.join(self.lock_directory, config_name + '.lock')
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def signature(self, config_name):
+        try:
+            stat = os.stat(self.get_file_path(config_name))
+        except OSError:
+            return 0
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
     def read(self, config_name, default=None, check_exist=False):
+        """
+        Parsed documents are cached until the file changes, the returned
+        data is shared and must not be modified.
+        """
         file_path = self.get_file_path(config_name)
         try:
+            stat = os.stat(file_path)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            parsed = self._parsed.get(config_name)
+            if parsed is not None and parsed[0] == signature:
+                return parsed[1]
             with io.open(file_path, encoding=self.__charset__) as open_file:
                 source_data = json.load(open_file)
+            self._parsed.set(config_name, (signature, source_data))
             logger.debug("Backend read json: {}".format(file_path))
         except IOError:
             logger.debug("Backend read json: {} (Ignored, file not Found)".format(file_path))
+            self._parsed.pop(config_name, None)
             if check_exist:
                 raise ProjectNoFoundException(config_name=config_name)
             source_data = default or {}
         return source_data
 
-    async def write(self, config_name, source_data, merge=False):
+    def save(self, config_name, source_data, merge=False, expected_version=None):
         file_path = self.get_file_path(config_name)
-        if self.os_util.file_exists(file_path) and merge:
-            with io.open(file_path, encoding=self.__charset__) as open_file:
-                object_merge(json.load(open_file), source_data)
+        with self.file_lock(config_name):
+            current = self.read(config_name)
+            if current and merge:
+                object_merge(current, source_data)
+            source_data['version'] = self.next_version(config_name, current, expected_version)
+            self.atomic_dump(file_path, source_data)
+        return source_data['version']
 
-        with io.open(file_path, "w", encoding=self.__charset__) as open_file:
-            json.dump(source_data, open_file)
-        await self.publish('callback_config_changed', config_name)
+    def update_keys(self, config_name, changes, expected_version=None):
+        file_path = self.get_file_path(config_name)
+        with self.file_lock(config_name):
+            try:
+                with io.open(file_path, encoding=self.__charset__) as open_file:
+                    source_data = json.load(open_file)
+            except IOError:
+                raise ProjectNoFoundException(config_name=config_name)
+            source_data['version'] = self.next_version(config_name, source_data, expected_version)
+            apply_key_changes(source_data, changes)
+            self.atomic_dump(file_path, source_data)
+        return source_data['version']
+
+    def atomic_dump(self, file_path, data):
+        """
+        Write to a temp file then rename over the target, readers see
+        either the old or the new document, never a partial one.
+        """
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.config_store_directory, prefix='.', suffix='.tmp')
+        try:
+            with io.open(fd, "w", encoding=self.__charset__) as open_file:
+                json.dump(data, open_file)
+                if self.config_store_fsync:
+                    open_file.flush()
+                    os.fsync(open_file.fileno())
+            os.replace(temp_path, file_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        if self.config_store_fsync:
+            dir_fd = os.open(self.config_store_directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
 
     def iter_backend(self):
         for root, _, file_names in OSUtils().walk(self.config_store_directory):
@@ -165,20 +585,69 @@ class JsonFileBackend(BaseBackend):
                     data=self.read(config_name)
                 )
 
-    async def delete(self, config_name):
+    def remove(self, config_name):
         file_path = self.get_file_path(config_name)
-        if self.os_util.file_exists(file_path):
-            self.os_util.remove_file(file_path)
-        await self.publish('callback_config_changed', config_name)
+        with self.file_lock(config_name):
+            if self.os_util.file_exists(file_path):
+                self.os_util.remove_file(file_path)
+        self._parsed.pop(config_name, None)
+
+    def create_change_bus(self):
+        return UnixSocketChangeBus(os.path.join(self.config_store_directory, 'cluster'))
+
+    def get_history_path(self, config_name):
+        return os.path.join(self.history_directory, config_name + self._history_extension)
+
+    def _read_history(self, file_path):
+        try:
+            with io.open(file_path, encoding=self.__charset__) as open_file:
+                return [line for line in open_file if line.strip()]
+        except IOError:
+            return []
+
+    def append_history(self, config_name, records):
+        file_path = self.get_history_path(config_name)
+        with self._history_lock:
+            if config_name not in self._history_lines:
+                self._history_lines[config_name] = len(self._read_history(file_path))
+            with io.open(file_path, "a", encoding=self.__charset__) as open_file:
+                for record in records:
+                    open_file.write(json.dumps(record) + '\n')
+            self._history_lines[config_name] += len(records)
+            if self._history_lines[config_name] > self.history_max_records * 1.5:
+                self.compact_history(config_name)
+
+    def compact_history(self, config_name):
+        """
+        Rewrite history segment keeping only the newest records.
+        """
+        file_path = self.get_history_path(config_name)
+        lines = self._read_history(file_path)[-self.history_max_records:]
+        temp_path = file_path + '.tmp'
+        with io.open(temp_path, "w", encoding=self.__charset__) as open_file:
+            open_file.writelines(lines)
+        os.replace(temp_path, file_path)
+        self._history_lines[config_name] = len(lines)
+
+    def query_history(self, config_name, env=None, key=None, page=1, limit=10):
+        records = [json.loads(line) for line in
+                   self._read_history(self.get_history_path(config_name))]
+        return page_history(records[::-1], env, key, page, limit)
+
+    def remove_history(self, config_name):
+        with self._history_lock:
+            self.os_util.remove_file(self.get_history_path(config_name))
+            self._history_lines.pop(config_name, None)
 
 
 class RedisBackend(BaseBackend):
     __visit_name__ = "redis"
     _config_data_scope = 'rt_config_data'
+    _config_history_scope = 'rt_config_history'
 
     @classmethod
     def configuration_schema(cls):
-        return {
+        return dict(super().configuration_schema(), **{
             'redis_url': {
                 'required': True,
                 'type': 'string',
@@ -196,64 +665,197 @@ class RedisBackend(BaseBackend):
                 'desc': '通知信道',
                 'default': 'rtc_config'
             },
-        }
+            'redis_max_connections': {
+                'required': False,
+                'type': 'int',
+                'desc': 'Redis连接池大小',
+                'default': 50
+            },
+            'redis_socket_timeout': {
+                'required': False,
+                'type': 'int',
+                'desc': 'Redis超时时间(秒)',
+                'default': 5
+            },
+            'redis_health_check_interval': {
+                'required': False,
+                'type': 'int',
+                'desc': 'Redis健康检查间隔(秒)',
+                'default': 30
+            },
+        })
 
-    def __init__(self, redis_url=None, open_notify=True, notify_channel=None, loop=None, notify_callback=None):
-        super().__init__(loop, notify_callback, open_notify)
+    def __init__(self, redis_url=None, open_notify=True, notify_channel=None, loop=None,
+                 notify_callback=None, project_cache=None, executor=None, redis_max_connections=50,
+                 redis_socket_timeout=5, redis_health_check_interval=30, history_max_records=1000,
+                 cluster_mode=False):
+        super().__init__(loop, notify_callback, open_notify, project_cache, executor,
+                         history_max_records, cluster_mode)
         self.redis_url = redis_url
         self.notify_channel = notify_channel
-        self._thread = None
+        self.redis_max_connections = redis_max_connections
+        self.redis_socket_timeout = redis_socket_timeout
+        self.redis_health_check_interval = redis_health_check_interval
+        self._redis_client = None
         if not redis_usable:
             raise RuntimeError('You need install [redis] package.')
 
     @property
-    def redis_client(self):
-        logger.debug("Creating Redis connection (%s)", self.redis_url)
-        redis_conf = urlparse(self.redis_url)
-        db = redis_conf.path[1] if redis_conf.path else 0
-        return redis.StrictRedis(
-            host=redis_conf.hostname,
-            port=redis_conf.port, db=db,
-            password=redis_conf.password
+    def connection_pool(self):
+        return get_redis_pool(
+            self.redis_url,
+            max_connections=self.redis_max_connections,
+            socket_timeout=self.redis_socket_timeout,
+            health_check_interval=self.redis_health_check_interval
         )
 
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = redis.StrictRedis(connection_pool=self.connection_pool)
+        return self._redis_client
+
+    def description(self):
+        stats = redis_pool_stats(self.connection_pool)
+        return dict(super().description(), **{
+            'Redis连接池(使用/空闲/已创建)': '%s/%s/%s' % (
+                stats['in_use'], stats['available'], stats['created'])
+        })
+
+    def get_env_key(self, config_name, env):
+        return '%s:%s:%s' % (self._config_data_scope, config_name, env)
+
+    def _read_document(self, client, config_name):
+        data = client.hget(self._config_data_scope, config_name)
+        return json.loads(data.decode(self.__charset__)) if data is not None else None
+
+    def signature(self, config_name):
+        # Every write bumps version of the project document (not the env hashes).
+        document = self._read_document(self.redis_client, config_name)
+        return document.get('version') if document is not None else 0
+
     def read(self, config_name, default=None, check_exist=False):
-        if isinstance(default, dict):
-            default = json.dumps(default).encode(self.__charset__)
-        else:
-            default = b'{}'
-        data = self.redis_client.hget(self._config_data_scope, config_name)
-        if data is None and check_exist:
-            raise ProjectNoFoundException(config_name=config_name)
-        return json.loads((data or default).decode(self.__charset__))
+        """
+        Project document keeps env names, keys of env are fields of a hash
+        per env. Documents written by older versions keep keys inline.
+        """
+        source_data = self._read_document(self.redis_client, config_name)
+        if source_data is None:
+            if check_exist:
+                raise ProjectNoFoundException(config_name=config_name)
+            return default if isinstance(default, dict) else {}
+        envs = [env for env, value in source_data.items() if isinstance(value, dict)]
+        pipe = self.redis_client.pipeline(transaction=False)
+        for env in envs:
+            pipe.hgetall(self.get_env_key(config_name, env))
+        for env, items in zip(envs, pipe.execute()):
+            source_data[env].update({
+                k.decode(self.__charset__): json.loads(v.decode(self.__charset__))
+                for k, v in items.items()})
+        return source_data
+
+    def _write_document(self, pipe, config_name, source_data, old_envs=()):
+        document, items = {}, {}
+        for name, value in source_data.items():
+            if isinstance(value, dict):
+                document[name] = {}
+                items[name] = {k: json.dumps(v) for k, v in value.items()}
+            else:
+                document[name] = value
+        pipe.hset(self._config_data_scope, config_name, json.dumps(document))
+        for env in set(old_envs) | set(items):
+            pipe.delete(self.get_env_key(config_name, env))
+        for env, mapping in items.items():
+            if mapping:
+                pipe.hset(self.get_env_key(config_name, env), mapping=mapping)
 
-    async def write(self, config_name, source_data, merge=False):
+    def save(self, config_name, source_data, merge=False, expected_version=None):
         if merge:
             object_merge(self.read(config_name), source_data)
-        self.redis_client.hset(
-            self._config_data_scope,
-            config_name,
-            json.dumps(source_data)
-        )
-        await self.publish('callback_config_changed', config_name)
+
+        def update(pipe):
+            document = self._read_document(pipe, config_name)
+            source_data['version'] = self.next_version(config_name, document, expected_version)
+            pipe.multi()
+            self._write_document(pipe, config_name, source_data, document or {})
+        # Transaction is retried if any project document changes after WATCH.
+        self.redis_client.transaction(update, self._config_data_scope)
+        return source_data['version']
+
+    def update_keys(self, config_name, changes, expected_version=None):
+        def update(pipe):
+            document = self._read_document(pipe, config_name)
+            if document is None:
+                raise ProjectNoFoundException(config_name=config_name)
+            version = self.next_version(config_name, document, expected_version)
+            if any(isinstance(v, dict) and v for v in document.values()):
+                # Inline keys of older versions, split the whole document once.
+                source_data = self.read(config_name)
+                apply_key_changes(source_data, changes)
+                source_data['version'] = version
+                pipe.multi()
+                self._write_document(pipe, config_name, source_data, document)
+                return version
+            document.update({env: {} for env, _, _ in changes if env not in document})
+            document['version'] = version
+            pipe.multi()
+            pipe.hset(self._config_data_scope, config_name, json.dumps(document))
+            for env, key, item in changes:
+                if item is None:
+                    pipe.hdel(self.get_env_key(config_name, env), key)
+                else:
+                    pipe.hset(self.get_env_key(config_name, env), key, json.dumps(item))
+            return version
+        return self.redis_client.transaction(
+            update, self._config_data_scope, value_from_callable=True)
 
     def iter_backend(self):
         return (i.decode(self.__charset__) for i in
                 self.redis_client.hkeys(self._config_data_scope))
 
-    async def delete(self, config_name):
-        self.redis_client.hdel(self._config_data_scope, config_name)
-        await self.publish('callback_config_changed', config_name)
+    def remove(self, config_name):
+        document = self._read_document(self.redis_client, config_name) or {}
+        pipe = self.redis_client.pipeline()
+        pipe.hdel(self._config_data_scope, config_name)
+        for env, value in document.items():
+            if isinstance(value, dict):
+                pipe.delete(self.get_env_key(config_name, env))
+        pipe.execute()
+
+    def create_change_bus(self):
+        # Subscriber connection blocks while idle, it must not share the
+        # pool whose socket timeout would break it.
+        return RedisChangeBus(redis.StrictRedis.from_url(self.redis_url), self.notify_channel)
+
+    def get_history_key(self, config_name):
+        return '%s:%s' % (self._config_history_scope, config_name)
+
+    def append_history(self, config_name, records):
+        pipe = self.redis_client.pipeline(transaction=False)
+        for record in records:
+            pipe.xadd(self.get_history_key(config_name), {'record': json.dumps(record)},
+                      maxlen=self.history_max_records, approximate=True)
+        pipe.execute()
+
+    def query_history(self, config_name, env=None, key=None, page=1, limit=10):
+        entries = self.redis_client.xrevrange(self.get_history_key(config_name))
+        records = [json.loads(fields[b'record'].decode(self.__charset__))
+                   for _, fields in entries]
+        return page_history(records, env, key, page, limit)
+
+    def remove_history(self, config_name):
+        self.redis_client.delete(self.get_history_key(config_name))
 
 
 class MongodbBackend(BaseBackend):
     __visit_name__ = "mongodb"
     _config_data_scope = 'rt_config_data'
     _config_publish_scope = 'rt_config_publish'
+    _config_history_scope = 'rt_config_history'
 
     @classmethod
     def configuration_schema(cls):
-        return {
+        return dict(super().configuration_schema(), **{
             'mongodb_url': {
                 'required': True,
                 'type': 'string',
@@ -264,25 +866,38 @@ class MongodbBackend(BaseBackend):
                 'type': 'bool',
                 'desc': '开启通知',
                 'default': True
-            }
-        }
+            },
+            'mongodb_max_pool_size': {
+                'required': False,
+                'type': 'int',
+                'desc': 'Mongodb连接池大小',
+                'default': 100
+            },
+        })
 
-    def __init__(self, mongodb_url=None, open_notify=True, loop=None, notify_callback=None):
-        super().__init__(loop, notify_callback, open_notify)
+    def __init__(self, mongodb_url=None, open_notify=True, loop=None, notify_callback=None,
+                 project_cache=None, executor=None, mongodb_max_pool_size=100,
+                 history_max_records=1000, cluster_mode=False):
+        super().__init__(loop, notify_callback, open_notify, project_cache, executor,
+                         history_max_records, cluster_mode)
         self.mongodb_url = mongodb_url
-        self._tsp = None
-        self._thread = None
-        self._clear_date = None
-        self.async_lock = asyncio.Lock()
+        self.mongodb_max_pool_size = mongodb_max_pool_size
         if not mongodb_usable:
             raise RuntimeError('You need install [pymongo] package.')
+        ensure_mongo_index(self.db_client[self._config_data_scope], 'config_name')
+        ensure_mongo_index(self.db_client[self._config_history_scope],
+                           [('config_name', 1), ('env', 1), ('key', 1), ('created', -1)],
+                           unique=False)
 
     @property
     def db_client(self):
-        logger.debug("Creating Mongodb connection (%s)", self.mongodb_url)
-        res = pymongo.uri_parser.parse_uri(self.mongodb_url, warn=True)
-        db_connection = pymongo.MongoClient(self.mongodb_url)
-        return db_connection[res["database"]]
+        return get_mongo_database(self.mongodb_url, self.mongodb_max_pool_size)
+
+    def signature(self, config_name):
+        model = self.db_client[self._config_data_scope].find_one(
+            {'config_name': config_name}, projection={'_id': False, 'data.version': True,
+                                                      'lut': True})
+        return ((model.get('data') or {}).get('version'), model.get('lut')) if model else 0
 
     def read(self, config_name, default=None, check_exist=False):
         model = self.db_client[self._config_data_scope].find_one({'config_name': config_name})
@@ -293,31 +908,314 @@ class MongodbBackend(BaseBackend):
                 return default
         return model['data']
 
-    async def write(self, config_name, source_data, merge=False):
-        db = self.db_client
-        if merge:
-            object_merge(self.read(config_name), source_data)
-        model = db[self._config_data_scope].find_one({'config_name': config_name})
+    @staticmethod
+    def version_query(config_name, version):
+        # Documents written by older versions have no version field.
+        return {'config_name': config_name,
+                'data.version': version if version else {'$in': [0, None]}}
+
+    def save(self, config_name, source_data, merge=False, expected_version=None):
+        collection = self.db_client[self._config_data_scope]
+        model = collection.find_one({'config_name': config_name})
+        if model and merge:
+            object_merge(model['data'], source_data)
+        version = self.next_version(
+            config_name, model['data'] if model else None, expected_version)
+        source_data['version'] = version
         if not model:
-            db[self._config_data_scope].insert_one(dict(
-                config_name=config_name,
-                data=source_data,
-                created=datetime.datetime.now(),
-                lut=datetime.datetime.now(),
-            ))
+            try:
+                collection.insert_one(dict(
+                    config_name=config_name,
+                    data=source_data,
+                    created=datetime.datetime.now(),
+                    lut=datetime.datetime.now(),
+                ))
+            except pymongo.errors.DuplicateKeyError:
+                raise ConfigVersionException(config_name=config_name)
         else:
-            db[self._config_data_scope].update_one(
-                {'config_name': config_name},
+            result = collection.update_one(
+                self.version_query(config_name, version - 1),
                 {'$set': dict(
                     data=source_data,
                     lut=datetime.datetime.now()
                 )}
             )
-        await self.publish('callback_config_changed', config_name)
+            if not result.matched_count:
+                raise ConfigVersionException(config_name=config_name)
+        return version
+
+    def update_keys(self, config_name, changes, expected_version=None):
+        collection = self.db_client[self._config_data_scope]
+        update = {'$set': {'lut': datetime.datetime.now()}, '$inc': {'data.version': 1}}
+        for env, key, item in changes:
+            if item is None:
+                update.setdefault('$unset', {})['data.%s.%s' % (env, key)] = ''
+            else:
+                update['$set']['data.%s.%s' % (env, key)] = item
+        if expected_version is None:
+            query = {'config_name': config_name}
+        else:
+            query = self.version_query(config_name, int(expected_version))
+        model = collection.find_one_and_update(
+            query, update, projection={'data.version': True},
+            return_document=pymongo.ReturnDocument.AFTER)
+        if model is None:
+            if collection.count_documents({'config_name': config_name}):
+                raise ConfigVersionException(config_name=config_name)
+            raise ProjectNoFoundException(config_name=config_name)
+        return model['data']['version']
 
     def iter_backend(self):
         return (i for i in self.db_client[self._config_data_scope].find())
 
-    async def delete(self, config_name):
+    def remove(self, config_name):
         self.db_client[self._config_data_scope].remove({'config_name': config_name})
-        await self.publish('callback_config_changed', config_name)
+
+    def create_change_bus(self):
+        return MongodbChangeBus(self.db_client[self._config_publish_scope])
+
+    def append_history(self, config_name, records):
+        collection = self.db_client[self._config_history_scope]
+        now = datetime.datetime.now()
+        collection.insert_many([dict(record, config_name=config_name, created=now)
+                                for record in records])
+        expired = collection.find_one(
+            {'config_name': config_name}, sort=[('created', -1), ('_id', -1)],
+            skip=self.history_max_records, projection=['_id'])
+        if expired:
+            collection.delete_many({'config_name': config_name, '_id': {'$lte': expired['_id']}})
+
+    def query_history(self, config_name, env=None, key=None, page=1, limit=10):
+        collection = self.db_client[self._config_history_scope]
+        query = {'config_name': config_name}
+        if env is not None:
+            query['env'] = env
+        if key is not None:
+            query['key'] = key
+        cursor = collection.find(query, projection={'_id': False, 'config_name': False,
+                                                    'created': False})
+        records = cursor.sort([('created', -1), ('_id', -1)]).skip((page - 1) * limit).limit(limit)
+        return collection.count_documents(query), list(records)
+
+    def remove_history(self, config_name):
+        self.db_client[self._config_history_scope].delete_many({'config_name': config_name})
+
+
+class SqliteBackend(BaseBackend):
+    """
+    Single node store in one sqlite database, every env key is a row so
+    key changes are single row upserts.
+    """
+    __visit_name__ = "sqlite"
+    _config_project_scope = 'rt_config_project'
+    _config_item_scope = 'rt_config_item'
+    _config_history_scope = 'rt_config_history'
+
+    @classmethod
+    def configuration_schema(cls):
+        return dict(super().configuration_schema(), **{
+            'sqlite_path': {
+                'required': False,
+                'type': 'string',
+                'desc': 'Sqlite数据库文件',
+                'default': '~/config/rtconfig.db'
+            },
+        })
+
+    def __init__(self, sqlite_path, loop=None, notify_callback=None, project_cache=None,
+                 executor=None, history_max_records=1000, cluster_mode=False):
+        super().__init__(loop, notify_callback, project_cache=project_cache,
+                         executor=executor, history_max_records=history_max_records,
+                         cluster_mode=cluster_mode)
+        self.sqlite_path = os.path.abspath(os.path.expanduser(sqlite_path))
+        os.makedirs(os.path.dirname(self.sqlite_path), exist_ok=True)
+        self.init_tables()
+
+    @property
+    def db_client(self):
+        return get_sqlite_connection(self.sqlite_path)
+
+    def init_tables(self):
+        self.db_client.executescript('''
+            CREATE TABLE IF NOT EXISTS {project} (
+                config_name TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                created TEXT NOT NULL,
+                lut TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS {item} (
+                config_name TEXT NOT NULL,
+                env TEXT NOT NULL,
+                key TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (config_name, env, key)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS {history} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                config_name TEXT NOT NULL,
+                env TEXT,
+                key TEXT,
+                record TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS {history}_key_idx
+                ON {history} (config_name, env, key, id);
+        '''.format(project=self._config_project_scope, item=self._config_item_scope,
+                   history=self._config_history_scope))
+
+    @staticmethod
+    def split_document(source_data):
+        """
+        Split document into the project row keeping env names with empty
+        env dicts, and the (env, key, item) rows.
+        """
+        document, items = {}, []
+        for name, value in source_data.items():
+            if isinstance(value, dict):
+                document[name] = {}
+                items.extend((name, key, item) for key, item in value.items())
+            else:
+                document[name] = value
+        return document, items
+
+    def _read_document(self, conn, config_name):
+        row = conn.execute(
+            'SELECT data FROM %s WHERE config_name = ?' % self._config_project_scope,
+            (config_name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def signature(self, config_name):
+        row = self.db_client.execute(
+            'SELECT lut FROM %s WHERE config_name = ?' % self._config_project_scope,
+            (config_name,)).fetchone()
+        return row[0] if row else 0
+
+    def read(self, config_name, default=None, check_exist=False):
+        conn = self.db_client
+        conn.execute('BEGIN')
+        try:
+            source_data = self._read_document(conn, config_name)
+            if source_data is not None:
+                for env, key, data in conn.execute(
+                        'SELECT env, key, data FROM %s WHERE config_name = ?'
+                        % self._config_item_scope, (config_name,)):
+                    source_data.setdefault(env, {})[key] = json.loads(data)
+        finally:
+            conn.execute('COMMIT')
+        if source_data is None:
+            if check_exist:
+                raise ProjectNoFoundException(config_name=config_name)
+            return default
+        return source_data
+
+    def _save_document(self, conn, config_name, document):
+        now = datetime.datetime.now().isoformat()
+        conn.execute(
+            'INSERT INTO %s (config_name, data, created, lut) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (config_name) DO UPDATE SET data = excluded.data, lut = excluded.lut'
+            % self._config_project_scope, (config_name, json.dumps(document), now, now))
+
+    def _upsert_items(self, conn, config_name, items):
+        conn.executemany(
+            'INSERT INTO %s (config_name, env, key, data) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (config_name, env, key) DO UPDATE SET data = excluded.data'
+            % self._config_item_scope,
+            [(config_name, env, key, json.dumps(item)) for env, key, item in items])
+
+    def save(self, config_name, source_data, merge=False, expected_version=None):
+        if merge:
+            object_merge(self.read(config_name, default={}), source_data)
+        with sqlite_transaction(self.db_client) as conn:
+            source_data['version'] = self.next_version(
+                config_name, self._read_document(conn, config_name), expected_version)
+            document, items = self.split_document(source_data)
+            self._save_document(conn, config_name, document)
+            conn.execute('DELETE FROM %s WHERE config_name = ?' % self._config_item_scope,
+                         (config_name,))
+            self._upsert_items(conn, config_name, items)
+        return source_data['version']
+
+    def update_keys(self, config_name, changes, expected_version=None):
+        with sqlite_transaction(self.db_client) as conn:
+            document = self._read_document(conn, config_name)
+            if document is None:
+                raise ProjectNoFoundException(config_name=config_name)
+            document['version'] = self.next_version(config_name, document, expected_version)
+            for env, _, _ in changes:
+                document.setdefault(env, {})
+            self._save_document(conn, config_name, document)
+            self._upsert_items(conn, config_name, [
+                (env, key, item) for env, key, item in changes if item is not None])
+            conn.executemany(
+                'DELETE FROM %s WHERE config_name = ? AND env = ? AND key = ?'
+                % self._config_item_scope,
+                [(config_name, env, key) for env, key, item in changes if item is None])
+        return document['version']
+
+    def iter_backend(self):
+        conn = self.db_client
+        projects = {}
+        conn.execute('BEGIN')
+        try:
+            for config_name, data, lut in conn.execute(
+                    'SELECT config_name, data, lut FROM %s' % self._config_project_scope):
+                projects[config_name] = dict(
+                    config_name=config_name,
+                    data=json.loads(data),
+                    lut=datetime.datetime.fromisoformat(lut)
+                )
+            for config_name, env, key, data in conn.execute(
+                    'SELECT config_name, env, key, data FROM %s' % self._config_item_scope):
+                if config_name in projects:
+                    projects[config_name]['data'].setdefault(env, {})[key] = json.loads(data)
+        finally:
+            conn.execute('COMMIT')
+        return iter(projects.values())
+
+    def remove(self, config_name):
+        with sqlite_transaction(self.db_client) as conn:
+            conn.execute('DELETE FROM %s WHERE config_name = ?' % self._config_item_scope,
+                         (config_name,))
+            conn.execute('DELETE FROM %s WHERE config_name = ?' % self._config_project_scope,
+                         (config_name,))
+
+    def last_modified(self, config_name):
+        row = self.db_client.execute(
+            'SELECT lut FROM %s WHERE config_name = ?' % self._config_project_scope,
+            (config_name,)).fetchone()
+        return datetime.datetime.fromisoformat(row[0]) if row else None
+
+    def create_change_bus(self):
+        return UnixSocketChangeBus(os.path.join(os.path.dirname(self.sqlite_path), 'cluster'))
+
+    def append_history(self, config_name, records):
+        with sqlite_transaction(self.db_client) as conn:
+            conn.executemany(
+                'INSERT INTO %s (config_name, env, key, record) VALUES (?, ?, ?, ?)'
+                % self._config_history_scope,
+                [(config_name, r.get('env'), r.get('key'), json.dumps(r)) for r in records])
+            conn.execute(
+                'DELETE FROM {0} WHERE config_name = ? AND id <= (SELECT id FROM {0} '
+                'WHERE config_name = ? ORDER BY id DESC LIMIT 1 OFFSET ?)'.format(
+                    self._config_history_scope),
+                (config_name, config_name, self.history_max_records))
+
+    def query_history(self, config_name, env=None, key=None, page=1, limit=10):
+        where, params = ['config_name = ?'], [config_name]
+        if env is not None:
+            where.append('env = ?')
+            params.append(env)
+        if key is not None:
+            where.append('key = ?')
+            params.append(key)
+        where = ' AND '.join(where)
+        conn = self.db_client
+        count = conn.execute('SELECT COUNT(*) FROM %s WHERE %s' % (
+            self._config_history_scope, where), params).fetchone()[0]
+        rows = conn.execute('SELECT record FROM %s WHERE %s ORDER BY id DESC LIMIT ? OFFSET ?' % (
+            self._config_history_scope, where), params + [limit, (page - 1) * limit])
+        return count, [json.loads(row[0]) for row in rows]
+
+    def remove_history(self, config_name):
+        with sqlite_transaction(self.db_client) as conn:
+            conn.execute('DELETE FROM %s WHERE config_name = ?' % self._config_history_scope,
+                         (config_name,))
@@ -0,0 +1,216 @@
+import os
+import json
+import uuid
+import time
+import socket
+import asyncio
+import logging
+import datetime
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BaseChangeBus:
+    """
+    Broadcast change notifications between server processes and nodes,
+    every node pushes changes to its own websocket clients.
+    """
+    # Manager callbacks other nodes may run, messages of others are dropped.
+    callbacks = frozenset(['callback_config_changed'])
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex[:12]
+        self.loop = None
+        self.callback = None
+        self.closed = False
+        self.received_num = 0
+        self.published_num = 0
+
+    def start(self, loop, callback):
+        self.loop = loop
+        self.callback = callback
+        self.listen()
+
+    def listen(self):
+        raise NotImplementedError
+
+    def send(self, payload):
+        raise NotImplementedError
+
+    def publish(self, message):
+        self.send(json.dumps(dict(node=self.node_id, message=message)))
+        self.published_num += 1
+
+    def dispatch(self, payload):
+        """
+        Schedule callback of message from other nodes on the server loop,
+        it is safe to call from listener threads.
+        """
+        try:
+            if isinstance(payload, bytes):
+                payload = payload.decode('utf-8')
+            data = json.loads(payload)
+            self.validate(json.loads(data['message']))
+        except (ValueError, UnicodeDecodeError, KeyError, TypeError, AttributeError) as ex:
+            logger.warning('Invalid change bus message: %s', str(ex))
+            return
+        if data.get('node') == self.node_id:
+            return
+        self.received_num += 1
+        asyncio.run_coroutine_threadsafe(self.callback(data['message']), self.loop)
+
+    def validate(self, message):
+        if message.get('func') not in self.callbacks:
+            raise ValueError('callback %r not allowed' % message.get('func'))
+        if message.get('kwargs') or not all(isinstance(arg, str) for arg in message['args']):
+            raise ValueError('invalid callback arguments')
+
+    def run_thread(self, target):
+        thread = threading.Thread(target=target, name='rtc-bus', daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.closed = True
+
+    def description(self):
+        return {
+            '集群节点': self.node_id,
+            '集群消息(发送/接收)': '%s/%s' % (self.published_num, self.received_num),
+        }
+
+
+class RedisChangeBus(BaseChangeBus):
+    def __init__(self, redis_client, channel):
+        super().__init__()
+        self.redis_client = redis_client
+        self.channel = channel
+
+    def send(self, payload):
+        self.redis_client.publish(self.channel, payload)
+
+    def listen(self):
+        self.run_thread(self._listen)
+
+    def _listen(self):
+        import redis
+        while not self.closed:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for item in pubsub.listen():
+                    if self.closed:
+                        break
+                    self.dispatch(item['data'])
+            except redis.RedisError as ex:
+                logger.error('Redis change bus error: %s, resubscribe.', str(ex))
+                time.sleep(1)
+
+
+class MongodbChangeBus(BaseChangeBus):
+    """
+    Publish messages into a capped by ttl collection, nodes follow it with
+    change stream, or poll it if mongodb is not a replica set.
+    """
+    poll_interval = 1
+    expire_seconds = 3600
+
+    def __init__(self, collection):
+        super().__init__()
+        self.collection = collection
+
+    def send(self, payload):
+        self.collection.insert_one(dict(payload=payload, created=datetime.datetime.utcnow()))
+
+    def listen(self):
+        import pymongo.errors
+        try:
+            self.collection.create_index('created', expireAfterSeconds=self.expire_seconds)
+        except pymongo.errors.PyMongoError as ex:
+            logger.warning('Create change bus ttl index failed: %s', str(ex))
+        self.run_thread(self._listen)
+
+    def _listen(self):
+        import pymongo.errors
+        try:
+            with self.collection.watch([{'$match': {'operationType': 'insert'}}]) as stream:
+                for change in stream:
+                    if self.closed:
+                        return
+                    self.dispatch(change['fullDocument']['payload'])
+        except pymongo.errors.OperationFailure as ex:
+            logger.info('Mongodb change stream unavailable (%s), poll instead.', str(ex))
+        self._poll()
+
+    def _poll(self):
+        import pymongo
+        import pymongo.errors
+        last = self.collection.find_one(sort=[('_id', pymongo.DESCENDING)], projection=['_id'])
+        last_id = last['_id'] if last else None
+        while not self.closed:
+            time.sleep(self.poll_interval)
+            try:
+                query = {'_id': {'$gt': last_id}} if last_id else {}
+                for item in self.collection.find(query).sort('_id', pymongo.ASCENDING):
+                    last_id = item['_id']
+                    self.dispatch(item['payload'])
+            except pymongo.errors.PyMongoError as ex:
+                logger.error('Mongodb change bus error: %s', str(ex))
+
+
+class UnixSocketChangeBus(BaseChangeBus):
+    """
+    Datagram sockets in a shared directory, for server processes of one
+    host sharing the json file store.
+    """
+    _extension = '.sock'
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, self.node_id + self._extension)
+        self.sock = None
+
+    def listen(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        self.loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        try:
+            while True:
+                self.dispatch(self.sock.recv(65536))
+        except BlockingIOError:
+            pass
+
+    def send(self, payload):
+        payload = payload.encode('utf-8')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if not name.endswith(self._extension) or path == self.path:
+                    continue
+                try:
+                    sock.sendto(payload, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Socket left by a dead process.
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                except OSError as ex:
+                    logger.warning('Send change bus message to %s failed: %s', path, str(ex))
+
+    def close(self):
+        super().close()
+        if self.sock is not None:
+            self.loop.remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
@@ -1,5 +1,9 @@
 import os
+import json
+import time
 import types
+import random
+import tempfile
 import asyncio
 import threading
 import importlib
@@ -7,6 +11,10 @@ import traceback
 import websockets
 from rtconfig.message import *
 from urllib.parse import urljoin
+from collections import OrderedDict
+from rtconfig.utils import apply_patch, to_hash, HashTree
+from rtconfig.compression import decode_message
+from rtconfig.shared import SharedConfig
 from rtconfig.exceptions import RTConfigServerError
 
 try:
@@ -24,10 +32,168 @@ STATUS_RUN = 'run'
 STATUS_STOP = 'stop'
 
 
-class RtConfigClient:
+class ConfigHolderMixin:
+    """
+    Config data of one (config_name, env) and the modules it is written to.
+    """
+    _shared_config = None
+    _hash_tree = None
+    error = None
+
+    @property
+    def data(self):
+        return self._data
+
+    def make_config_module(self, config_module=None):
+        if isinstance(config_module, (str, dict, types.ModuleType)):
+            config_module = [config_module]
+        elif not isinstance(config_module, list):
+            config_module = []
+        self.config_to_module(*config_module)
+
+    def config_to_module(self, *config_modules):
+        for module in config_modules:
+            if isinstance(module, str):
+                module = importlib.import_module(module)
+            self._load_config_modules.append(module)
+
+    def change_module_config(self, keys=None):
+        """
+        Write config into registered modules, only given keys if specified,
+        keys not in config any more are removed.
+        """
+        if keys is None:
+            config_data = dict(self.data, CONFIG_NAME=self.config_name)
+            removed = []
+        else:
+            config_data = {key: self.data[key] for key in keys if key in self.data}
+            removed = [key for key in keys if key not in self.data]
+
+        def _load_config_module_data(config_module):
+            if isinstance(config_module, types.ModuleType):
+                config_module = config_module.__dict__
+            if not isinstance(config_module, dict):
+                return
+            config_module.update(config_data)
+            for key in removed:
+                config_module.pop(key, None)
+        list(map(_load_config_module_data, self._load_config_modules))
+
+    def no_change(self, message):
+        pass
+
+    def changed(self, message):
+        self.logger.info('Config changed: %s', message)
+        self.hash_code = message.hash_code
+        self._data = message.data
+        self.change_module_config()
+        self.save_snapshot()
+
+    def patch(self, message):
+        base, ops = message.data.get('base'), message.data.get('ops') or []
+        if base != self.hash_code:
+            self.logger.warning('Config patch base %s mismatch, reload full config.', base)
+            self.hash_code = ''
+            return
+        data, changed_keys = apply_patch(self._data, ops)
+        # Unchanged values are shared with current data, their hashes are reused.
+        previous = self._hash_tree
+        if previous is not None and previous.data is not self._data:
+            previous = None
+        hash_tree = HashTree(data, previous)
+        if hash_tree.hash_code != message.hash_code:
+            self.logger.warning('Config patch hash mismatch, reload full config.')
+            self.hash_code = ''
+            return
+        self.logger.info('Config patched: %s', ', '.join(changed_keys))
+        self.hash_code = message.hash_code
+        self._data = data
+        self._hash_tree = hash_tree
+        self.change_module_config(changed_keys)
+        self.save_snapshot()
+
+    @property
+    def snapshot_path(self):
+        if not self.snapshot_dir:
+            return None
+        return os.path.join(os.path.expanduser(self.snapshot_dir),
+                            '%s.%s.json' % (self.config_name, self.env))
+
+    def save_snapshot(self):
+        """
+        Write config data and hash code atomically, a crash while writing
+        never leaves a broken snapshot.
+        """
+        file_path = self.snapshot_path
+        if not file_path:
+            return
+        try:
+            directory = os.path.dirname(file_path)
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(dict(config_name=self.config_name, env=self.env,
+                                   hash_code=self.hash_code, data=self._data), f)
+                os.replace(temp_path, file_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            if self._shared_config is not None:
+                self._shared_config.bump()
+        except Exception as ex:
+            self.logger.warning('Save config snapshot %s failed: %s', file_path, str(ex))
+
+    def load_snapshot(self):
+        """
+        Load config from local snapshot, return True if loaded.
+        """
+        file_path = self.snapshot_path
+        if not (file_path and os.path.isfile(file_path)):
+            return False
+        try:
+            with open(file_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            data, hash_code = snapshot['data'], snapshot['hash_code']
+        except Exception as ex:
+            self.logger.warning('Load config snapshot %s failed: %s', file_path, str(ex))
+            return False
+        self.hash_code = hash_code
+        self._data = data
+        self.change_module_config()
+        self.logger.info('Config loaded from snapshot: %s', file_path)
+        return True
+
+
+class ConfigSubscription(ConfigHolderMixin):
+    """
+    Extra config project received over the connection of a client.
+    """
+    def __init__(self, client, config_name, env='default', config_module=None):
+        self.client = client
+        self.config_name = config_name
+        self.env = env
+        self.hash_code = ''
+        self.send_flag = True
+        self.logger = client.logger
+        self.snapshot_dir = client.snapshot_dir
+        self._data = {}
+        self._load_config_modules = []
+        self.make_config_module(config_module)
+        self.load_snapshot()
+
+    @property
+    def _shared_config(self):
+        return self.client._shared_config
+
+
+class RtConfigClient(ConfigHolderMixin):
     _ignore_environs = [
         'LS_COLORS'
     ]
+    _keep_environs = [
+        'HOSTNAME'
+    ]
     _environ_variables = [
         'name',
         'ws_url',
@@ -36,7 +202,9 @@ class RtConfigClient:
         'ping_interval',
         'retry_interval'
         'debug',
-        'force_exit'
+        'force_exit',
+        'snapshot_dir',
+        'shared'
     ]
 
     def __init__(self,
@@ -46,6 +214,8 @@ class RtConfigClient:
                  ping_interval=60 * 5,
                  retry_interval=5,
                  recv_interval=1,
+                 ping_timeout=20,
+                 retry_max_interval=60,
                  config_module=None,
                  daemon=True,
                  auto_start=True,
@@ -55,7 +225,11 @@ class RtConfigClient:
                  env='default',
                  force_exit=True,
                  token=None,
-                 run_loop=True):
+                 run_loop=True,
+                 patch=True,
+                 compress=True,
+                 snapshot_dir='~/.rtconfig',
+                 shared=False):
         self._data = {}
         self._thread = None
         self.debug = debug
@@ -65,6 +239,9 @@ class RtConfigClient:
         self.ping_interval = ping_interval
         self.retry_interval = retry_interval
         self.recv_interval = recv_interval
+        self.ping_timeout = ping_timeout
+        self.retry_max_interval = retry_max_interval
+        self.retry_times = 0
         self.logger = logger or logging.getLogger(__name__)
         self._load_config_modules = []
         self.daemon = daemon
@@ -79,6 +256,20 @@ class RtConfigClient:
         self.token = token
         self.run_loop = run_loop
         self.force_exit = force_exit
+        self.patch_enabled = patch
+        self.compress_enabled = compress
+        self.snapshot_dir = snapshot_dir
+        self.shared = shared
+        self._shared_config = None
+        self._shared_version = None
+        self.received_bytes = 0
+        self.payload_bytes = 0
+        self.subscriptions = OrderedDict()
+        self._unsubscribed = []
+        self.environ_keys = {}
+        self.context_registered = False
+        self._context = None
+        self._registered_digest = None
         self.status = STATUS_RUN
         assert isinstance(self.context, dict)
         config_logging(self.log_file_name, logger=self.logger)
@@ -92,13 +283,6 @@ class RtConfigClient:
         asyncio.set_event_loop(loop)
         return asyncio.get_event_loop()
 
-    def make_config_module(self, config_module=None):
-        if isinstance(config_module, (str, dict, types.ModuleType)):
-            config_module = [config_module]
-        elif not isinstance(config_module, list):
-            config_module = []
-        self.config_to_module(*config_module)
-
     def load_environ(self):
         load_dotenv()
         for name in self._environ_variables:
@@ -107,62 +291,134 @@ class RtConfigClient:
                 continue
             setattr(self, name, os.environ[key])
 
-    @property
-    def data(self):
-        return self._data
-    
     @property
     def connect_url(self):
         return urljoin(self.ws_url, 'connect')
 
-    def config_to_module(self, *config_modules):
-        for module in config_modules:
-            if isinstance(module, str):
-                module = importlib.import_module(module)
-            self._load_config_modules.append(module)
+    def get_features(self):
+        features = [FEATURE_CONTEXT]
+        if self.patch_enabled:
+            features.append(FEATURE_PATCH)
+        if self.compress_enabled:
+            features.append(FEATURE_ZLIB)
+        return features
 
-    def change_module_config(self):
-        def _load_config_module_data(config_module):
-            config_data = dict(self.data, CONFIG_NAME=self.config_name)
-            for key, value in config_data.items():
-                if isinstance(config_module, types.ModuleType):
-                    config_module.__dict__[key] = value
-                elif isinstance(config_module, dict):
-                    config_module[key] = value
-        list(map(_load_config_module_data, self._load_config_modules))
+    def iter_holders(self):
+        yield self
+        yield from list(self.subscriptions.values())
 
-    def no_change(self, message):
-        pass
+    def get_holder(self, config_name, env):
+        if (config_name, env) == (self.config_name, self.env):
+            return self
+        return self.subscriptions.get((config_name, env))
 
-    def changed(self, message):
-        self.logger.info('Config changed: %s', message)
-        self.hash_code = message.hash_code
-        self._data = message.data
-        self.change_module_config()
+    def subscribe(self, config_name, env='default', config_module=None):
+        """
+        Receive one more config project over the connection of client.
+        """
+        holder = self.get_holder(config_name, env)
+        if holder is None:
+            holder = ConfigSubscription(self, config_name, env, config_module)
+            self.subscriptions[(config_name, env)] = holder
+            self._context = None
+            self.wakeup()
+        elif config_module is not None:
+            holder.make_config_module(config_module)
+        return holder
 
-    def get_context(self):
-        self.load_environ()
+    def unsubscribe(self, config_name, env='default'):
+        if self.subscriptions.pop((config_name, env), None) is not None:
+            self._unsubscribed.append((config_name, env))
+            self._context = None
+            self.wakeup()
+
+    def wakeup(self):
+        """
+        Interrupt waiting for server messages, pending pulls are sent at once.
+        """
+        task = self.task
+        if task is not None:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+    def reset_send_flag(self):
+        for holder in self.iter_holders():
+            holder.send_flag = True
+
+    def get_environ(self):
         environ = dict(os.environ)
         for key in self._ignore_environs:
             environ.pop(key, None)
-        return dict(
-            pid=os.getpid(),
-            ping_interval=self.ping_interval,
-            retry_interval=self.retry_interval,
-            recv_interval=self.recv_interval,
-            daemon=self.daemon,
-            auto_start=self.auto_start,
-            environ=environ,
-            **self.context
-        )
+        config_names = {holder.config_name for holder in self.iter_holders()}
+        if config_names.issubset(self.environ_keys):
+            keys = set(self._keep_environs)
+            for config_name in config_names:
+                keys.update(self.environ_keys[config_name])
+            environ = {key: value for key, value in environ.items() if key in keys}
+        return environ
+
+    def get_context(self):
+        if self._context is None:
+            context = dict(
+                pid=os.getpid(),
+                features=self.get_features(),
+                ping_interval=self.ping_interval,
+                retry_interval=self.retry_interval,
+                recv_interval=self.recv_interval,
+                daemon=self.daemon,
+                auto_start=self.auto_start,
+                environ=self.get_environ(),
+                **self.context
+            )
+            context['context_digest'] = to_hash(context)
+            self._context = context
+        return self._context
+
+    def refresh_context(self):
+        """
+        Reload environ after it changed, context is registered again
+        with the next message.
+        """
+        self.load_environ()
+        self._context = None
 
-    def get_message(self):
+    def apply_options(self, options, config_name=None):
+        """
+        Return True if server needs environ values it was not sent yet,
+        all holders then pull again with the new context.
+        """
+        if not options:
+            return False
+        self.context_registered = True
+        if 'environ_keys' not in options:
+            return False
+        environ_keys = options['environ_keys']
+        sent = (self._context or {}).get('environ') or {}
+        self.environ_keys[config_name or self.config_name] = environ_keys
+        self._context = None
+        environ = self.get_context()['environ']
+        if any(key in environ and key not in sent for key in environ_keys):
+            self.reset_send_flag()
+            return True
+        return False
+
+    def get_message_context(self):
+        context = self.get_context()
+        digest = context['context_digest']
+        if not self.context_registered:
+            return context
+        if digest == self._registered_digest:
+            return {'context_digest': digest}
+        self._registered_digest = digest
+        return context
+
+    def get_message(self, holder=None):
+        holder = holder or self
         return Message(
                 "no_change",
-                self.config_name,
-                self.hash_code,
-                env=self.env,
-                context=self.get_context()
+                holder.config_name,
+                holder.hash_code,
+                env=holder.env,
+                context=self.get_message_context()
             ).get_pull_message()
 
     def close(self):
@@ -176,27 +432,69 @@ class RtConfigClient:
         if self._thread:
             self._thread.join()
             self._thread = None
+        if self._shared_config is not None:
+            self._shared_config.close()
 
-    async def send_message(self, ws, ping=False):
-        if self.send_flag:
-            await ws.send(self.get_message())
-        received_msg = await ws.recv()
+    async def send_pending(self, ws, ping=False):
+        for holder in ([self] if ping else self.iter_holders()):
+            if holder.send_flag:
+                await ws.send(self.get_message(holder))
+                holder.send_flag = False
+        while self._unsubscribed and not ping:
+            config_name, env = self._unsubscribed[0]
+            await ws.send(Message(
+                MT_UNSUBSCRIBE,
+                config_name,
+                '',
+                env=env,
+                context=self.get_message_context()
+            ).get_pull_message())
+            self._unsubscribed.pop(0)
+
+    def handle_message(self, received_msg, ping=False):
+        self.received_bytes += len(received_msg)
+        received_msg = decode_message(received_msg)
+        self.payload_bytes += len(received_msg)
         json_data = json.loads(received_msg)
         try:
             message = Message(**json_data)
         except TypeError as ex:
-            raise RTConfigServerError(json_data.get('error_msg', str(ex)))
-        message_handler = getattr(self, message.message_type, None)
+            error_msg = json_data.get('error_msg', str(ex))
+            holder = self.get_holder(json_data.get('config_name'), json_data.get('env'))
+            if holder is None or holder is self:
+                raise RTConfigServerError(error_msg)
+            # A failed subscription is pulled again after reconnecting,
+            # the connection is kept for the other projects.
+            self.logger.error('Config subscription %s(%s) failed: %s',
+                              holder.config_name, holder.env, error_msg)
+            holder.error = error_msg
+            holder.send_flag = False
+            return
+        resend = self.apply_options(message.options, message.config_name)
+        holder = self.get_holder(message.config_name, message.env)
+        if holder is None:
+            return
+        holder.error = None
+        message_handler = getattr(holder, message.message_type, None)
         if message_handler and callable(message_handler):
             message_handler(message)
-        self.send_flag = ping or message.response_mode == RESPONSE_MODE_REPLY
+        holder.send_flag = resend or ping or not holder.hash_code or \
+            message.response_mode == RESPONSE_MODE_REPLY
         self.first_connection = ping
 
+    async def send_message(self, ws, ping=False):
+        await self.send_pending(ws, ping)
+        self.handle_message(await ws.recv(), ping)
+
     def get_connection(self):
+        self._registered_digest = None
         params = dict(
             extra_headers=dict(
                 authorization_token=self.token or ""
-            )
+            ),
+            # large pushes are zlib framed once per snapshot by the server
+            # (FEATURE_ZLIB), permessage-deflate would compress them again
+            compression=None
         )
         return websockets.connect(self.connect_url, **params)
 
@@ -204,17 +502,48 @@ class RtConfigClient:
         async with self.get_connection() as ws:
             await self.send_message(ws, ping=True)
 
+    async def keepalive(self, ws):
+        """
+        Websocket level ping, a connection without pong in time is closed
+        and the receive loop reconnects.
+        """
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            try:
+                await asyncio.wait_for(await ws.ping(), self.ping_timeout)
+            except asyncio.TimeoutError:
+                self.logger.warning('Config server pong timeout, reconnect.')
+                await ws.close()
+                return
+
     async def connect(self):
         async with self.get_connection() as ws:
-            while self.status == STATUS_RUN:
-                try:
-                    self.task = asyncio.ensure_future(self.send_message(ws))
-                    self.loop.call_later(self.ping_interval, self.task.cancel)
-                    await self.task
-                except asyncio.CancelledError:
-                    self.send_flag = True
-                finally:
-                    await asyncio.sleep(self.recv_interval)
+            self.retry_times = 0
+            keepalive = asyncio.ensure_future(self.keepalive(ws))
+            try:
+                while self.status == STATUS_RUN:
+                    await self.send_pending(ws)
+                    # Only receiving is cancelled by wakeup(), messages are
+                    # dispatched as soon as they arrive.
+                    self.task = asyncio.ensure_future(ws.recv())
+                    try:
+                        received_msg = await self.task
+                    except asyncio.CancelledError:
+                        continue
+                    finally:
+                        self.task = None
+                    self.handle_message(received_msg)
+            finally:
+                keepalive.cancel()
+
+    def get_retry_delay(self):
+        """
+        Exponential backoff with jitter, so clients do not reconnect all
+        at once after server restarted.
+        """
+        delay = min(self.retry_max_interval, self.retry_interval * 2 ** self.retry_times)
+        self.retry_times += 1
+        return random.uniform(delay / 2.0, delay)
 
     async def loop_connect(self):
         while True:
@@ -226,15 +555,35 @@ class RtConfigClient:
             finally:
                 if self.status != STATUS_RUN:
                     break
+                delay = self.get_retry_delay()
                 self.logger.info(
-                    'Retry to connect config server: %s.',
-                    self.ws_url
+                    'Retry to connect config server %s in %.1fs.',
+                    self.ws_url, delay
                 )
-                self.send_flag = True
-                await asyncio.sleep(self.retry_interval)
+                self.reset_send_flag()
+                await asyncio.sleep(delay)
+
+    def shared_loop(self):
+        """
+        Follow config published by the agent of host, take over the agent
+        role once it is free, e.g. the agent process exited.
+        """
+        while self.status == STATUS_RUN:
+            if self._shared_config.acquire():
+                self.logger.info('Became config agent of host, pid: %s.', os.getpid())
+                self.loop.run_until_complete(self.loop_connect())
+                return
+            version = self._shared_config.version()
+            if version != self._shared_version:
+                self._shared_version = version
+                for holder in self.iter_holders():
+                    holder.load_snapshot()
+            time.sleep(self.recv_interval)
 
     def run_forever(self):
         def loop_async(ping=False):
+            if self._shared_config is not None and not ping:
+                return self.shared_loop()
             loop_handler = self.ping if ping else self.loop_connect
             self.loop.run_until_complete(loop_handler())
 
@@ -242,12 +591,20 @@ class RtConfigClient:
             raise RuntimeError('RtConfig client is running.')
         if not self.ws_url:
             raise RuntimeError('RtConfig client ws_url must be support.')
-        try:
-            loop_async(ping=True)
-        except Exception as ex:
-            if self.force_exit:
-                raise ex
-            self.logger.exception(traceback.format_exc())
+        if self.shared and self._shared_config is None:
+            if not self.snapshot_path:
+                raise RuntimeError('RtConfig client shared mode needs snapshot_dir.')
+            self._shared_config = SharedConfig(os.path.splitext(self.snapshot_path)[0])
+        from_snapshot = self.load_snapshot()
+        # The connect loop sends the snapshot hash code and gets the
+        # changes in background, so waiting for the server is needless.
+        if not (from_snapshot and self.run_loop and self.data.get('CLIENT_RUN_LOOP', True)):
+            try:
+                loop_async(ping=True)
+            except Exception as ex:
+                if self.force_exit and not from_snapshot:
+                    raise ex
+                self.logger.exception(traceback.format_exc())
         if not (self.run_loop and self.data.get('CLIENT_RUN_LOOP', True)):
             return
         try:
@@ -0,0 +1,61 @@
+import zlib
+from rtconfig.message import FEATURE_ZLIB
+
+
+class MessageCompressor:
+    """
+    Compress push messages above threshold with zlib for clients that
+    support it, compressed messages are sent as binary frames.
+    """
+    def __init__(self, threshold=16384, level=6):
+        self.threshold = threshold
+        self.level = level
+        self.message_num = 0
+        self.compressed_num = 0
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+
+    def should_compress(self, push_message, message=None):
+        return self.threshold >= 0 and len(push_message) >= self.threshold and \
+            message is not None and message.support(FEATURE_ZLIB)
+
+    def encode(self, push_message, message=None, cache=None):
+        """
+        Return text or compressed binary payload, cache is a dict shared by
+        clients receiving the same push message (the snapshot).
+        """
+        compress = self.should_compress(push_message, message)
+        try:
+            size, payload = cache[(push_message, compress)]
+        except (KeyError, TypeError):
+            raw = push_message.encode('utf-8')
+            size = len(raw)
+            payload = zlib.compress(raw, self.level) if compress else push_message
+            if cache is not None:
+                cache[(push_message, compress)] = size, payload
+        self.message_num += 1
+        self.raw_bytes += size
+        if compress:
+            self.compressed_num += 1
+            self.sent_bytes += len(payload)
+        else:
+            self.sent_bytes += size
+        return payload
+
+    @property
+    def ratio(self):
+        return round(self.sent_bytes * 100.0 / self.raw_bytes, 2) if self.raw_bytes else 100.0
+
+    def description(self):
+        return {
+            '压缩消息数/总消息数': '%s/%s' % (self.compressed_num, self.message_num),
+            '原始字节数': self.raw_bytes,
+            '发送字节数': self.sent_bytes,
+            '压缩比': '%s%%' % self.ratio,
+        }
+
+
+def decode_message(payload):
+    if isinstance(payload, bytes):
+        return zlib.decompress(payload).decode('utf-8')
+    return payload
@@ -0,0 +1,162 @@
+import itertools
+from rtconfig.exceptions import ContextNotRegisteredException
+
+
+def get_host_name(message):
+    try:
+        return message.context['environ'].get('HOSTNAME', 'unknown')
+    except (KeyError, AttributeError):
+        return 'unknown'
+
+
+class ConnectionRegistry:
+    """
+    Registry of client websocket connections and their subscriptions.
+
+    One connection may subscribe several (config_name, env) pairs. Keeps
+    per-project and host indexes of subscriptions so counting and the
+    paginated client listing never iterate all connections.
+    """
+    def __init__(self):
+        self.messages = {}
+        self.sockets = {}
+        self.projects = {}
+        self.hosts = {}
+        self.project_hosts = {}
+        self._keys = {}
+
+    def __len__(self):
+        return len(self.sockets)
+
+    def __contains__(self, ws):
+        return ws in self.sockets
+
+    @staticmethod
+    def subscription_key(ws, message):
+        return ws, message.config_name, message.env
+
+    def count(self, config_name=None):
+        if config_name is None:
+            return len(self.messages)
+        return len(self.projects.get(config_name) or ())
+
+    def _index_key(self, message):
+        pid = message.context.get('pid', '--')
+        return message.config_name, get_host_name(message), pid
+
+    def add(self, ws, message):
+        """
+        Register or refresh subscription, return True if it is a new one.
+        """
+        sub_key = self.subscription_key(ws, message)
+        key = self._index_key(message)
+        created = sub_key not in self.messages
+        if not created and self._keys.get(sub_key) != key:
+            self._remove(sub_key)
+            created = True
+        self.messages[sub_key] = message
+        if created:
+            config_name, host_name, _ = key
+            self._keys[sub_key] = key
+            self.sockets.setdefault(ws, {})[sub_key] = None
+            self.projects.setdefault(config_name, {})[sub_key] = None
+            self.hosts.setdefault(host_name, {})[sub_key] = None
+            self.project_hosts.setdefault(config_name, {}).setdefault(host_name, {})[sub_key] = None
+        return created
+
+    def remove(self, ws, config_name=None, env='default'):
+        """
+        Remove one subscription or all of the connection, return removed messages.
+        """
+        if config_name is not None:
+            sub_keys = [(ws, config_name, env)]
+        else:
+            sub_keys = list(self.sockets.get(ws) or ())
+        return [message for message in map(self._remove, sub_keys) if message is not None]
+
+    def _remove(self, sub_key):
+        message = self.messages.pop(sub_key, None)
+        key = self._keys.pop(sub_key, None)
+        if key is None:
+            return message
+        config_name, host_name, _ = key
+        for index, index_key in [(self.sockets, sub_key[0]),
+                                 (self.projects, config_name),
+                                 (self.hosts, host_name)]:
+            self._discard(index, index_key, sub_key)
+        project_hosts = self.project_hosts.get(config_name)
+        if project_hosts is not None:
+            self._discard(project_hosts, host_name, sub_key)
+            if not project_hosts:
+                del self.project_hosts[config_name]
+        return message
+
+    @staticmethod
+    def _discard(index, key, sub_key):
+        bucket = index.get(key)
+        if bucket is None:
+            return
+        bucket.pop(sub_key, None)
+        if not bucket:
+            del index[key]
+
+    def iter_project(self, config_name):
+        for sub_key in list(self.projects.get(config_name) or ()):
+            message = self.messages.get(sub_key)
+            if message is not None:
+                yield sub_key[0], message
+
+    def page(self, config_name=None, page=1, limit=10):
+        """
+        Return subscriptions of one page ordered by host name.
+        """
+        hosts = self.hosts if config_name is None \
+            else self.project_hosts.get(config_name) or {}
+        offset, result = (page - 1) * limit, []
+        for host_name in sorted(hosts):
+            bucket = hosts[host_name]
+            if offset >= len(bucket):
+                offset -= len(bucket)
+                continue
+            for sub_key in itertools.islice(bucket, offset, None):
+                result.append((sub_key[0], self.messages[sub_key]))
+                if len(result) >= limit:
+                    return result
+            offset = 0
+        return result
+
+
+class ClientSession:
+    """
+    Context registered by one client connection.
+
+    Clients supporting context registration send the full context once
+    with its digest, following pull messages only carry the digest.
+    """
+    def __init__(self):
+        self.context = None
+        self.digest = None
+        self.environ_keys = {}
+
+    def resolve(self, message):
+        context = message.context or {}
+        digest = context.get('context_digest')
+        if digest is None:
+            return
+        if len(context) > 1:
+            self.context, self.digest = context, digest
+        elif digest == self.digest:
+            message.context = self.context
+        else:
+            raise ContextNotRegisteredException(digest=digest)
+
+    def get_options(self, config_name, environ_keys):
+        """
+        Return options telling client the environ keys project refers to,
+        only when they are not told yet.
+        """
+        environ_keys = sorted(environ_keys)
+        if self.digest is None or environ_keys == self.environ_keys.get(config_name):
+            return {}
+        self.environ_keys[config_name] = environ_keys
+        return {'environ_keys': environ_keys}
@@ -0,0 +1,78 @@
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyGraph:
+    """
+    In-memory parent -> children index of config projects.
+    """
+    def __init__(self):
+        self.parents = {}
+        self.children = {}
+
+    def __contains__(self, config_name):
+        return config_name in self.parents
+
+    def __len__(self):
+        return len(self.parents)
+
+    def update(self, config_name, parents):
+        parents = tuple(parents or [])
+        for parent in self.parents.get(config_name, ()):
+            self.children.get(parent, set()).discard(config_name)
+        self.parents[config_name] = parents
+        for parent in parents:
+            self.children.setdefault(parent, set()).add(config_name)
+
+    def remove(self, config_name):
+        for parent in self.parents.pop(config_name, ()):
+            self.children.get(parent, set()).discard(config_name)
+
+    def creates_cycle(self, config_name, parents):
+        """
+        Check whether setting parents of config_name would make a cycle.
+        """
+        stack, visited = list(parents or []), set()
+        while stack:
+            name = stack.pop()
+            if name == config_name:
+                return True
+            if name in visited:
+                continue
+            visited.add(name)
+            stack.extend(self.parents.get(name, ()))
+        return False
+
+    def dependents(self, config_name):
+        """
+        Return all transitive children of config_name in topological order,
+        parents always come before their children.
+        """
+        closure, queue = set(), deque([config_name])
+        while queue:
+            for child in self.children.get(queue.popleft(), ()):
+                if child not in closure and child != config_name:
+                    closure.add(child)
+                    queue.append(child)
+        in_degree = {
+            name: len({p for p in self.parents.get(name, ())
+                      if p in closure or p == config_name})
+            for name in closure
+        }
+        queue = deque([config_name])
+        result = []
+        while queue:
+            for child in sorted(self.children.get(queue.popleft(), ())):
+                if child not in in_degree:
+                    continue
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    result.append(child)
+                    queue.append(child)
+        cyclic = sorted(name for name, degree in in_degree.items() if degree > 0)
+        if cyclic:
+            logger.warning('Config dependency cycle detected: %s', ', '.join(cyclic))
+            result.extend(cyclic)
+        return result
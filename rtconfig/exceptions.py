@@ -22,11 +22,18 @@ class BaseConfigException(Exception):
     def __str__(self):
         return self.description.format(**self.options)
 
-    def get_message(self):
-        return json.dumps({
+    def get_message(self, message=None):
+        """
+        Error reply, it names the project and env of the client message
+        if given so the client fails only that subscription.
+        """
+        error = {
             'code': self.code,
             'error_msg': str(self)
-        })
+        }
+        if message is not None:
+            error.update(config_name=message.config_name, env=message.env)
+        return json.dumps(error)
 
 
 class ProjectNoFoundException(BaseConfigException):
@@ -59,11 +66,21 @@ class ProjectEnvErrorException(BaseConfigException):
     description = "Project {config_name} env [{env}] or value error."
 
 
+class ProjectDependencyErrorException(BaseConfigException):
+    code = 403
+    description = "Project {config_name} parent dependency cycle."
+
+
 class ConfigVersionException(BaseConfigException):
     code = 400
     description = "Project {config_name} version changed error."
 
 
+class ContextNotRegisteredException(BaseConfigException):
+    code = 401
+    description = "Client context {digest} not registered."
+
+
 class GlobalApiException(Exception):
     def __init__(self, msg):
         self.msg = msg
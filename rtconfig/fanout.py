@@ -0,0 +1,121 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from rtconfig.message import MT_CHANGED, RESPONSE_MODE_REPLY
+from rtconfig.exceptions import BaseConfigException
+
+
+class LatencyRecorder:
+    """
+    Keep recent latency samples (seconds) and report percentiles.
+    """
+    def __init__(self, size=10000):
+        self._samples = deque(maxlen=size)
+
+    def record(self, value):
+        self._samples.append(value)
+
+    def percentile(self, percent, samples=None):
+        samples = samples or sorted(self._samples)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(percent / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def stats(self):
+        samples = sorted(self._samples)
+        return {
+            'p%s' % p: round(self.percentile(p, samples) * 1000, 2)
+            for p in (50, 90, 99)
+        }
+
+
+class ChangeFanout:
+    """
+    Push changed config to connected clients.
+
+    Connections are grouped by snapshot key, every group resolves and
+    serializes its payload once, sends run concurrently with a bounded
+    concurrency and a per-send timeout so one slow client does not stall
+    the others.
+    """
+    def __init__(self, concurrency=256, send_timeout=5, logger=None, compressor=None):
+        self.concurrency = concurrency
+        self.send_timeout = send_timeout
+        self.compressor = compressor
+        self.logger = logger or logging.getLogger(__name__)
+        self.delivery_latency = LatencyRecorder()
+        self.fanout_latency = LatencyRecorder(size=1000)
+        self.sent_num = 0
+        self.failed_num = 0
+
+    def group_connections(self, config_project, connections):
+        groups = {}
+        for ws, message in connections:
+            try:
+                with config_project.use_env(message.env, message.context):
+                    key = config_project.snapshot_key()
+            except BaseConfigException as ex:
+                self.logger.warning('[%s] Skip push client %s: %s',
+                                    config_project.config_name,
+                                    message.context.get('pid'), str(ex))
+                continue
+            groups.setdefault(key, []).append((ws, message))
+        return groups
+
+    async def send(self, semaphore, ws, push_message, start_time, message=None, hash_code=None):
+        async with semaphore:
+            try:
+                await asyncio.wait_for(ws.send(push_message), self.send_timeout)
+            except asyncio.TimeoutError:
+                self.failed_num += 1
+                self.logger.warning('Push client timeout after %ss.', self.send_timeout)
+                return False
+            except Exception as ex:
+                self.failed_num += 1
+                self.logger.error('Push client error: %s', str(ex))
+                return False
+        self.sent_num += 1
+        if message is not None:
+            # Later patches are made against the hash code the client now holds.
+            message.hash_code = hash_code
+        self.delivery_latency.record(time.monotonic() - start_time)
+        return True
+
+    async def push(self, config_project, connections):
+        start_time = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        for members in self.group_connections(config_project, connections).values():
+            ws, message = members[0]
+            with config_project.use_env(message.env, message.context):
+                snapshot = config_project.get_snapshot()
+            for ws, message in members:
+                if message.hash_code == snapshot.hash_code:
+                    continue
+                push_message = config_project.changed_message(
+                    snapshot, message, RESPONSE_MODE_REPLY)
+                if self.compressor is not None:
+                    push_message = self.compressor.encode(
+                        push_message, message, snapshot.compressed)
+                message.message_type = MT_CHANGED
+                tasks.append(self.send(semaphore, ws, push_message, start_time,
+                                       message, snapshot.hash_code))
+        if not tasks:
+            return 0
+        results = await asyncio.gather(*tasks)
+        cost = time.monotonic() - start_time
+        self.fanout_latency.record(cost)
+        self.logger.info('[%s] Config changed, pushed %s/%s clients in %.3fs.',
+                         config_project.config_name, sum(results), len(results), cost)
+        return sum(results)
+
+    def description(self):
+        delivery, fanout = self.delivery_latency.stats(), self.fanout_latency.stats()
+        return {
+            '推送成功数': self.sent_num,
+            '推送失败数': self.failed_num,
+            '推送延迟P50/P90/P99(ms)': '/'.join(str(delivery[k]) for k in ('p50', 'p90', 'p99')),
+            '扇出耗时P50/P90/P99(ms)': '/'.join(str(fanout[k]) for k in ('p50', 'p90', 'p99')),
+        }
@@ -0,0 +1,87 @@
+import copy
+import operator
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError('%s is immutable, copy it to modify.' % self.__class__.__name__)
+
+
+class FrozenDict(dict):
+    """
+    Read only dict shared between cached documents and resolved configs.
+    It is still a dict for json and isinstance checks, copy() and
+    copy.deepcopy() give mutable dicts.
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def copy(self):
+        return dict(self)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return {copy.deepcopy(k, memo): copy.deepcopy(v, memo) for k, v in self.items()}
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class FrozenList(list):
+    """
+    Read only list, see FrozenDict.
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = clear = sort = reverse = _immutable
+
+    def copy(self):
+        return list(self)
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(v, memo) for v in self]
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+_missing = object()
+
+
+def freeze_data(data, previous=_missing):
+    """
+    Frozen version of data, frozen subtrees are shared as they are. Parts
+    equal to previous (former frozen version of data) are taken from it,
+    so unchanged values keep their identity when a document is reloaded.
+    """
+    if isinstance(data, (FrozenDict, FrozenList)):
+        return data
+    if isinstance(data, dict):
+        if not isinstance(previous, FrozenDict):
+            return FrozenDict((key, freeze_data(value)) for key, value in data.items())
+        items, same = [], len(data) == len(previous)
+        for key, value in data.items():
+            old = previous.get(key, _missing)
+            value = freeze_data(value, old)
+            same = same and value is old
+            items.append((key, value))
+        return previous if same else FrozenDict(items)
+    if isinstance(data, list):
+        if not isinstance(previous, FrozenList):
+            return FrozenList(freeze_data(value) for value in data)
+        values = [freeze_data(value, previous[idx] if idx < len(previous) else _missing)
+                  for idx, value in enumerate(data)]
+        if len(values) == len(previous) and all(map(operator.is_, values, previous)):
+            return previous
+        return FrozenList(values)
+    # type check keeps 1, 1.0 and True apart, they are equal but dump differently
+    if type(data) is type(previous) and data == previous:
+        return previous
+    return data
@@ -1,5 +1,7 @@
 import json
 import logging
+import threading
+from collections import OrderedDict
 from rtconfig.exceptions import GlobalApiException
 
 
@@ -153,6 +155,76 @@ class LinkDict(dict):
     del calls_update
 
 
+class LRUCache:
+    """
+    Size bounded least-recently-used cache with hit/miss counters.
+    """
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None, check=None):
+        """
+        Cached value of key, a value failing check is outdated and counts
+        as a miss, it is kept until replaced or popped.
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if check is not None and not check(value):
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return round(self.hits * 100.0 / total, 2) if total else 0.0
+
+    def stats(self):
+        return dict(
+            size=len(self._data),
+            max_size=self.max_size,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            hit_rate=self.hit_rate,
+        )
+
+
 class WebsocketHandler(logging.Handler):
     terminator = '\n'
 
@@ -185,12 +257,22 @@ class WebsocketHandler(logging.Handler):
             self.handleError(record)
 
 
-def page_result(request, data):
-    assert isinstance(data, list)
+def page_params(request):
     page = int(request.args.get('page', 1))
     limit = int(request.args.get('limit', 10))
+    return page, limit
+
+
+def page_result(request, data, count=None):
+    """
+    Paginated api result, data is already sliced if count is given.
+    """
+    assert isinstance(data, list)
+    if count is None:
+        page, limit = page_params(request)
+        count, data = len(data), data[(page - 1) * limit: page * limit]
     return {
         "code": 0,
-        "count": len(data),
-        "data": data[(page - 1) * limit: page * limit]
+        "count": count,
+        "data": data
     }
@@ -1,33 +1,44 @@
 import os
 import re
 import copy
-import uuid
+import asyncio
 import datetime
 from rtconfig.message import *
 from rtconfig.exceptions import *
 from rtconfig.mixin import CallbackHandleMixin
-from rtconfig.utils import to_hash, OSUtils, format_env_data, strftime
-from rtconfig.backend import default_backends
-from rtconfig.helpers import _, CallbackSet, LinkDict
+from rtconfig.utils import to_hash, OSUtils, format_env_data, strftime, template_variables
+from rtconfig.backend import default_backends, page_history
+from rtconfig.helpers import LRUCache
+from rtconfig.frozen import freeze_data
+from rtconfig.snapshot import Snapshot, SnapshotStore
+from rtconfig.fanout import ChangeFanout
+from rtconfig.compression import MessageCompressor
+from rtconfig.dependency import DependencyGraph
+from rtconfig.metadata import ProjectIndex
+from rtconfig.connection import ConnectionRegistry, get_host_name
 from contextlib import contextmanager
-from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 
 
 ENV_DOMAIN = {
     'default': {},
     'environ': {},
-    'history': {},
     'parent': []
 }
 
 
 class ConfigProject:
-    def __init__(self, config_name, store_backend, env=None, context=None):
+    def __init__(self, config_name, store_backend, env=None, context=None, snapshots=None,
+                 loaded=None):
         self.config_name = config_name
         self.store_backend = store_backend
         self.env = env
         self.context = context
+        self.snapshots = snapshots
         self._source_data = None
+        # Documents of project chain loaded by prefetch, shared with parents.
+        self._loaded = {} if loaded is None else loaded
+        self._version = None
         self.request = None
     
     @contextmanager
@@ -54,12 +65,27 @@ class ConfigProject:
     def source_data(self):
         if self._source_data:
             return self._source_data
-        return self.store_backend.read(self.config_name, default=ENV_DOMAIN)
+        source_data = self._loaded.get(self.config_name)
+        if source_data is not None:
+            return source_data
+        return self.store_backend.load(self.config_name, default=ENV_DOMAIN)
+
+    def get_parent_project(self, parent):
+        return ConfigProject(parent, self.store_backend, loaded=self._loaded)
 
     @source_data.setter
     def source_data(self, value):
         self._source_data = value
 
+    @property
+    def version(self):
+        """
+        Stored version of project, bumped by every write.
+        """
+        if self._version is not None:
+            return self._version
+        return self.source_data.get('version') or 0
+
     def _get_data_from_env(self):
         return self.source_data.get(self.env) or {} \
             if self.env else self.source_data
@@ -68,122 +94,272 @@ class ConfigProject:
         return key in self._get_data_from_env()
 
     def record_history(self, env, source_data, data):
+        """
+        Return history records of changed keys, they are kept in the
+        history store of backend instead of the config document.
+        """
         if not (data and isinstance(data, dict)):
-            return
-        data = list(data.values())[0]
-        org_data = source_data[self.env].get(data['key']) or {}
-        if to_hash(org_data) == to_hash(data):
-            return
-        if 'history' not in source_data:
-            source_data['history'] = {}
-        source_data['history'].setdefault(env, {})
-        source_data['history'][env].setdefault(data['key'], [])
-        source_data['history'][env][data['key']].append(dict(
-            before=org_data,
-            after=data,
-            operator=self.request.user.id if self.request else None,
-            lut=strftime(datetime.datetime.now())
-        ))
-
-    async def set_source_data(self, data):
+            return []
+        records = []
+        for item in data.values():
+            org_data = source_data[env].get(item['key']) or {}
+            if to_hash(org_data) == to_hash(item):
+                continue
+            records.append(dict(
+                env=env,
+                key=item['key'],
+                before=org_data,
+                after=item,
+                operator=self.request.user.id if self.request else None,
+                lut=strftime(datetime.datetime.now())
+            ))
+        return records
+
+    @staticmethod
+    def pop_legacy_history(source_data):
+        """
+        Pop history embedded in config document by older versions.
+        """
+        records = []
+        for env, env_history in (source_data.pop('history', None) or {}).items():
+            for key, key_history in env_history.items():
+                records.extend(dict(i, env=env, key=key) for i in key_history)
+        return sorted(records, key=lambda i: i.get('lut') or '')
+
+    async def migrate_history(self, version=None):
+        """
+        Move legacy history out of document, return the version to expect
+        afterwards if version is given.
+        """
+        if 'history' not in self.source_data:
+            return version
+        source_data = copy.deepcopy(self.source_data)
+        records = self.pop_legacy_history(source_data)
+        await self.update_config(source_data, version)
+        await self.store_backend.aappend_history(self.config_name, records)
+        return self._version if version is not None else None
+
+    async def set_source_data(self, data, version=None):
+        """
+        Write data of env or the whole document, raise version exception
+        if version is given and project was changed since.
+        """
         assert isinstance(data, dict)
-        source_data = self.source_data
         if self.env:
-            source_data.setdefault(self.env, {})
-            self.record_history(self.env, source_data, data)
-            source_data[self.env].update(data)
-        else:
-            list(map(self.validate_env, data))
-            source_data = data
-        await self.update_config(source_data)
-
-    async def remove_source_data(self, keys):
+            version = await self.migrate_history(version)
+            records = self.record_history(
+                self.env, {self.env: self.source_data.get(self.env) or {}}, data)
+            self._version = await self.store_backend.awrite_keys(
+                self.config_name, self.env, data, version)
+            await self.store_backend.aappend_history(self.config_name, records)
+            await self.prefetch()
+            return self._version
+        records = self.pop_legacy_history(dict(self.source_data))
+        list(map(self.validate_env, data))
+        source_data = dict(data)
+        source_data.pop('history', None)
+        source_data.pop('version', None)
+        await self.update_config(source_data, version)
+        await self.store_backend.aappend_history(self.config_name, records)
+        return self._version
+
+    async def remove_source_data(self, keys, version=None):
         assert isinstance(keys, list)
-        source_data = self.source_data
         if self.env:
-            env_data = source_data.get(self.env) or {}
-        else:
-            env_data = source_data
+            self._version = await self.store_backend.adelete_keys(
+                self.config_name, self.env, keys, version)
+            await self.prefetch()
+            return self._version
+        source_data = dict(self.source_data)
         for key in keys:
-            try:
-                del env_data[key]
-            except KeyError:
-                continue
-        await self.update_config(source_data)
+            source_data.pop(key, None)
+        await self.update_config(source_data, version)
+        return self._version
 
     def get_hash_code(self):
-        return to_hash(self.get_env_data())
+        return self.get_snapshot().hash_code
 
-    async def update_config(self, source_data):
-        await self.store_backend.write(self.config_name, source_data)
+    async def update_config(self, source_data, version=None):
+        self._version = await self.store_backend.awrite(
+            self.config_name, source_data, expected_version=version)
+        await self.prefetch()
 
     async def remove_config(self):
-        await self.store_backend.delete(self.config_name)
+        await self.store_backend.adelete(self.config_name)
+
+    async def prefetch(self):
+        """
+        Load project and its parents without blocking the event loop, they
+        are kept by the project so following source_data access never
+        reads the store, even if the chain does not fit the project cache.
+        """
+        pending, loaded = [self.config_name], {}
+        while pending:
+            config_name = pending.pop()
+            if config_name in loaded:
+                continue
+            source_data = await self.store_backend.aread(config_name, default=ENV_DOMAIN)
+            loaded[config_name] = source_data
+            pending.extend(source_data.get('parent') or [])
+        self._loaded.clear()
+        self._loaded.update(loaded)
+        return self
 
     def get_env_kv_data(self, source_data, env):
         env_data = source_data.get(env) or {}
         return {i['key']: i['value'] for i in env_data.values()}
 
-    def get_env_data(self):
+    def get_env_data(self, visited=None):
+        """
+        Resolved data of env, values not changed by templates are shared
+        with the cached source documents, the result is frozen. Parents
+        already on the resolving path (a cycle) are skipped.
+        """
         env_data, env_var = {}, {}
-        source = copy.deepcopy(self.source_data)
+        visited = (visited or frozenset()) | {self.config_name}
+        source = self.source_data
         parent_configs = source.get('parent') or []
         for parent in parent_configs:
-            parent_config_project = ConfigProject(parent, self.store_backend)
+            if parent in visited:
+                continue
+            parent_config_project = self.get_parent_project(parent)
             with parent_config_project.use_env(
                     env=self.env,
                     context=self.context,
                     request=self.request
             ):
-                env_data.update(parent_config_project.get_env_data())
+                env_data.update(parent_config_project.get_env_data(visited))
                 env_var.update(parent_config_project.get_env_kv_data(
                     parent_config_project.source_data, 'environ'))
         for env in ['default', self.env]:
             env_data.update(self.get_env_kv_data(source, env))
         env_var.update(self.get_env_kv_data(source, 'environ'))
+        env_var.update(self.get_context_variables(env_var))
+        return freeze_data(format_env_data(env_data, **env_var))
 
+    def get_context_variables(self, keys):
         try:
-            if self.context:
-                environ = copy.copy(self.context['environ'])
-                environ.update(self.context)
-                for key, value in environ.items():
-                    if key not in env_var:
-                        continue
-                    env_var[key] = value
+            environ = copy.copy(self.context['environ'])
+            environ.update(self.context)
+            return {key: environ[key] for key in keys if key in environ}
         except:
-            pass
-        return format_env_data(env_data, **env_var)
-
-    def config_message(self, message, response_mode=RESPONSE_MODE_NOTIFY):
+            return {}
+
+    def iter_chain(self, visited=None):
+        """
+        Yield config name and source data of project and all its parents.
+        """
+        visited = set() if visited is None else visited
+        if self.config_name in visited:
+            return
+        visited.add(self.config_name)
+        source_data = self.source_data
+        yield self.config_name, source_data
+        for parent in source_data.get('parent') or []:
+            yield from self.get_parent_project(parent).iter_chain(visited)
+
+    def environ_keys(self):
+        """
+        Names of environ variables referred by project and its parents.
+        """
+        keys = set()
+        for _, source_data in self.iter_chain():
+            keys.update(source_data.get('environ') or {})
+        return keys
+
+    def template_variables(self, versions=None):
+        """
+        Names of variables referred by templates of env data and environ
+        of project chain, cached by versions of the chain.
+        """
+        key = (self.config_name, self.env, versions)
+        if versions is not None and self.snapshots is not None:
+            names = self.snapshots.variables.get(key)
+            if names is not None:
+                return names
+        names = set()
+        for _, source_data in self.iter_chain():
+            for env in ['default', self.env, 'environ']:
+                for item in (source_data.get(env) or {}).values():
+                    template_variables(item.get('value'), names)
+        names = frozenset(names)
+        if versions is not None and self.snapshots is not None:
+            self.snapshots.variables.set(key, names)
+        return names
+
+    def snapshot_key(self):
+        """
+        Stored versions of project chain and context variables referred by
+        templates identify the resolved data, no need to hash the payload.
+        """
+        versions, env_var_keys = [], set()
+        for config_name, source_data in self.iter_chain():
+            versions.append((config_name, source_data.get('version') or 0))
+            env_var_keys.update(source_data.get('environ') or {})
+        versions, variables = tuple(versions), {}
+        if self.context:
+            variables = self.get_context_variables(
+                env_var_keys & self.template_variables(versions))
+        return self.config_name, self.env, versions, to_hash(variables)
+
+    def get_snapshot(self):
+        key = self.snapshot_key() if self.snapshots is not None else None
+        snapshot = self.snapshots.get(key) if key else None
+        if snapshot is None:
+            previous = self.snapshots.latest(self.config_name, self.env) \
+                if self.snapshots is not None else None
+            snapshot = Snapshot.build(self.config_name, self.env, self.get_env_data(), previous)
+            if key:
+                self.snapshots.set(key, snapshot)
+                self.snapshots.remember(snapshot)
+        return snapshot
+
+    def changed_message(self, snapshot, message, response_mode=RESPONSE_MODE_NOTIFY):
+        """
+        Patch against the client hash code if client supports it and the
+        base snapshot is still known, otherwise the full payload.
+        """
+        if message.hash_code and message.support(FEATURE_PATCH) and self.snapshots is not None:
+            base_tree = self.snapshots.get_base(self.config_name, message.env, message.hash_code)
+            if base_tree is not None:
+                return snapshot.get_patch_message(message.hash_code, base_tree, response_mode)
+        return snapshot.get_push_message(response_mode)
+
+    def config_message(self, message, response_mode=RESPONSE_MODE_NOTIFY, compressor=None,
+                       options=None):
         with self.use_env(message.env, message.context):
-            env_hash_code = self.get_hash_code()
-            if message.hash_code == env_hash_code:
-                message_type, data = MT_NO_CHANGE, {}
-            else:
-                message_type, data = MT_CHANGED, self.get_env_data()
-            return Message(
-                message_type,
+            snapshot = self.get_snapshot()
+        if message.hash_code != snapshot.hash_code:
+            push_message = self.changed_message(snapshot, message, response_mode)
+            cache = snapshot.compressed
+        else:
+            push_message = Message(
+                MT_NO_CHANGE,
                 self.config_name,
-                env_hash_code,
-                data,
+                snapshot.hash_code,
                 request=message.request,
                 env=message.env,
                 response_mode=response_mode
             ).get_push_message()
+            cache = None
+        if options:
+            push_message, cache = attach_options(push_message, options), None
+        if compressor is not None:
+            push_message = compressor.encode(push_message, message, cache)
+        return push_message
 
     def detail_info(self, source_data=None):
         source_data = source_data or self.source_data
         return dict(
             config_name=self.config_name,
             source_data=source_data,
+            version=source_data.get('version') or 0,
             parent=",".join(source_data.get('parent') or [])
         )
 
 
 class ConfigManager(CallbackHandleMixin):
     _default_store_type = 'json_file'
-    _connection_pool = LinkDict()
-    _connection_message = LinkDict()
     _config_name_regex = re.compile('^[\u4e00-\u9fa5_a-zA-Z0-9_]+$')
 
     def __init__(self, app, os_utils=None, logger=None, log_file_name=None, store_type=None):
@@ -196,7 +372,27 @@ class ConfigManager(CallbackHandleMixin):
         self.store_type = store_type or self.app.config.get(
             'STORE_TYPE', self._default_store_type)
         self.store_backend = None
+        self.connections = ConnectionRegistry()
+        self.dependency_graph = DependencyGraph()
+        self.project_index = ProjectIndex()
+        self.project_cache = LRUCache(self.app.config.get('PROJECT_CACHE_SIZE', 256))
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.app.config.get('STORE_IO_WORKERS', 8),
+            thread_name_prefix='rtc-store')
+        self.snapshot_store = SnapshotStore(
+            self.app.config.get('SNAPSHOT_CACHE_SIZE', 1024),
+            self.app.config.get('PATCH_HISTORY_SIZE', 8))
+        self.compressor = MessageCompressor(
+            threshold=self.app.config.get('COMPRESS_THRESHOLD', 16384),
+            level=self.app.config.get('COMPRESS_LEVEL', 6))
+        self.fanout = ChangeFanout(
+            concurrency=self.app.config.get('FANOUT_CONCURRENCY', 256),
+            send_timeout=self.app.config.get('FANOUT_SEND_TIMEOUT', 5),
+            logger=self.logger,
+            compressor=self.compressor
+        )
         self.init_store_backend_instance()
+        self.build_project_index()
 
     @property
     def system_info(self):
@@ -204,20 +400,30 @@ class ConfigManager(CallbackHandleMixin):
             '存储方式': self.store_type,
             'DEBUG模式': self.debug,
             '最大连接数': self.max_connection,
+            '项目缓存容量': self.project_cache.max_size,
             **self.store_backend.description()
         }
 
-    @property
-    def client_info(self):
+    async def get_client_info(self):
         info = {
             '配置项目数': self.config_project_num(),
-            '客户端连接数': self.connection_num(),
+            '客户端连接数': len(self.connections),
+            '客户端订阅数': self.connection_num(),
+            '项目缓存命中': self.project_cache.hits,
+            '项目缓存未命中': self.project_cache.misses,
+            '项目缓存命中率': "%s%%" % self.project_cache.hit_rate,
+            '配置快照数': len(self.snapshot_store),
+            '配置快照命中率': "%s%%" % self.snapshot_store.hit_rate,
+            **self.fanout.description(),
+            **self.compressor.description()
         }
         try:
             import psutil
             p = psutil.Process(os.getpid())
+            cpu_percent = await asyncio.get_event_loop().run_in_executor(
+                None, p.cpu_percent, 1)
             info.update({
-                'CPU利用率': "%s%%" % round(p.cpu_percent(1), 2),
+                'CPU利用率': "%s%%" % round(cpu_percent, 2),
                 '内存利用率': "%s%%" % round(p.memory_percent(), 2),
             })
         except ImportError:
@@ -228,35 +434,52 @@ class ConfigManager(CallbackHandleMixin):
         store_backend_class = default_backends[self.store_type]
         options = store_backend_class.validate_options(
             self.app.config, loop=self.app.loop,
-            notify_callback=self.notify_changed)
+            notify_callback=self.notify_changed,
+            project_cache=self.project_cache,
+            executor=self.executor)
         self.store_backend = store_backend_class(**options)
 
     def connection_num(self, config_name=None):
-        return len(self.get_connection_clients(config_name))
+        return self.connections.count(config_name)
 
     def config_project_num(self):
-        return len(self.get_config_project_list())
+        return len(self.project_index)
 
     def get_config_project(self, config_name, check_exist=False):
         if check_exist:
-            self.store_backend.read(config_name, check_exist=True)
-        return ConfigProject(config_name, self.store_backend)
+            self.store_backend.load(config_name, check_exist=True)
+        return ConfigProject(config_name, self.store_backend,
+                             snapshots=self.snapshot_store)
 
-    def get_config_project_info(self, config_data):
+    async def load_config_project(self, config_name, check_exist=False):
+        if check_exist:
+            await self.store_backend.aread(config_name, check_exist=True)
+        return await self.get_config_project(config_name).prefetch()
+
+    async def get_config_project_info(self, config_data):
         if isinstance(config_data, dict):
             config_name = config_data['config_name']
             data = config_data['data']
         else:
             config_name, data = config_data, None
-        config_project = self.get_config_project(config_name)
+        if data is None:
+            config_project = await self.load_config_project(config_name)
+        else:
+            config_project = self.get_config_project(config_name)
         return dict(
             connect_num=self.connection_num(config_name),
             **config_project.detail_info(data)
         )
 
-    def get_config_project_list(self):
-        return [self.get_config_project_info(i)
-                for i in self.store_backend.iter_backend()]
+    def get_config_project_list(self, keyword=None, page=1, limit=10):
+        count, projects = self.project_index.search(keyword, page, limit)
+        return count, [dict(
+            project,
+            parent=",".join(project['parent']),
+            env_num=len(project['envs']),
+            key_num=sum(project['key_num'].values()),
+            connect_num=self.connection_num(project['config_name'])
+        ) for project in projects]
 
     def validate_name(self, name):
         return self._config_name_regex.match(name)
@@ -264,76 +487,99 @@ class ConfigManager(CallbackHandleMixin):
     async def create_config_project(self, config_name, parent=None, copy_from=None):
         if not self.validate_name(config_name):
             raise ProjectNameErrorException(config_name=config_name)
-        if config_name in [i['config_name'] for i in self.get_config_project_list()]:
+        try:
+            await self.store_backend.aread(config_name, check_exist=True)
+        except ProjectNoFoundException:
+            pass
+        else:
             raise ProjectExistException(config_name=config_name)
-        config_project = self.get_config_project(config_name)
+        config_project = await self.get_config_project(config_name).prefetch()
         if copy_from:
-            copy_from_project = self.get_config_project(copy_from)
+            copy_from_project = await self.load_config_project(copy_from)
             data = copy.deepcopy(copy_from_project.source_data)
+            data.pop('history', None)
+            data.pop('version', None)
         elif parent:
             data = dict(ENV_DOMAIN, parent=[parent])
         else:
             data = ENV_DOMAIN
+        self.validate_parent(config_name, data.get('parent'))
         with config_project.use_env():
             await config_project.set_source_data(data)
+        await self.index_config_project(config_name)
         return config_project
 
-    async def update_config_project(self, request, config_name, source_data, env=None):
-        config_project = self.get_config_project(config_name)
+    async def update_config_project(self, request, config_name, source_data, env=None,
+                                    version=None):
+        if not env and 'parent' in source_data:
+            self.validate_parent(config_name, source_data['parent'])
+        config_project = await self.load_config_project(config_name)
         with config_project.use_env(env=env, request=request):
-            await config_project.set_source_data(source_data)
+            await config_project.set_source_data(source_data, version)
+        await self.index_config_project(config_name)
         return config_project
 
-    async def add_env_config(self, request, config_name, env, data):
-        config_project = self.get_config_project(config_name)
+    async def add_env_config(self, request, config_name, env, data, version=None):
+        config_project = await self.load_config_project(config_name)
         with config_project.use_env(env=env, request=request):
-            await config_project.set_source_data(data)
+            await config_project.set_source_data(data, version)
+        await self.index_config_project(config_name)
         return config_project
 
-    async def remove_env_config(self, config_name, env, keys):
-        config_project = self.get_config_project(config_name)
+    async def remove_env_config(self, config_name, env, keys, version=None):
+        config_project = await self.load_config_project(config_name)
         with config_project.use_env(env):
-            await config_project.remove_source_data(keys)
+            await config_project.remove_source_data(keys, version)
+        await self.index_config_project(config_name)
         return config_project
 
-    def env_key_exist(self, config_name, env, key):
-        config_project = self.get_config_project(config_name)
+    async def env_key_exist(self, config_name, env, key):
+        config_project = await self.load_config_project(config_name)
         with config_project.use_env(env):
             return config_project.key_exist(key)
 
+    async def get_config_history(self, config_name, env=None, key=None, page=1, limit=10):
+        """
+        Query history of project, legacy history still embedded in the
+        document is read as older records, it is only moved out on write.
+        """
+        config_project = await self.load_config_project(config_name, check_exist=True)
+        source_data = config_project.source_data
+        if 'history' not in source_data:
+            return await self.store_backend.aquery_history(config_name, env, key, page, limit)
+        count, records = await self.store_backend.aquery_history(
+            config_name, env, key, 1, page * limit)
+        legacy_count, legacy_records = page_history(
+            config_project.pop_legacy_history(dict(source_data))[::-1],
+            env, key, 1, page * limit)
+        records = (records + legacy_records)[(page - 1) * limit: page * limit]
+        return count + legacy_count, records
+
     async def remove_config_project(self, config_name):
         config_project = self.get_config_project(config_name)
         await config_project.remove_config()
+        await self.index_config_project(config_name)
 
     async def add_connection(self, ws, message):
-        try:
-            if self.connection_num() > self.max_connection:
-                raise ConnectException(
-                    'Number of connection is already the '
-                    'maximum %s.' % self.max_connection
-                )
-            config_name = message.config_name
-            self.get_config_project(config_name)
-            self._connection_pool.setdefault(config_name, CallbackSet(
-                on_remove=self._connection_message))
-            if not hasattr(ws, 'ws_key'):
-                ws.ws_key = uuid.uuid4().hex
-            desc = 'report' if ws in self._connection_pool[config_name] else 'first'
-            self._connection_pool[config_name].add(ws)
-            self._connection_message[ws] = message
-            self.logger.info('[%s] Client %s connected, pid: %s.',
-                             message.config_name, desc,
-                             message.context['pid'])
-        except KeyError:
-            raise ProjectNoFoundException(config_name=message.config_name)
-
-    async def remove_connection(self, ws, message):
-        try:
-            self._connection_pool[message.config_name].remove(ws)
+        if ws not in self.connections and len(self.connections) >= self.max_connection:
+            raise ConnectException(
+                'Number of connection is already the '
+                'maximum %s.' % self.max_connection
+            )
+        desc = 'first' if self.connections.add(ws, message) else 'report'
+        self.logger.info('[%s] Client %s connected, pid: %s.',
+                         message.config_name, desc,
+                         message.context.get('pid'))
+
+    async def remove_connection(self, ws, message=None):
+        for message in self.connections.remove(ws):
             self.logger.info('[%s] Client disconnected: %s.',
-                             message.config_name, message.context['pid'])
-        except KeyError:
-            pass
+                             message.config_name, message.context.get('pid'))
+
+    async def remove_subscription(self, ws, message):
+        for message in self.connections.remove(ws, message.config_name, message.env):
+            self.logger.info('[%s] Client unsubscribed: %s.',
+                             message.config_name, message.context.get('pid'))
 
     def format_message_data(self, message):
         context = dict(
@@ -352,24 +598,72 @@ class ConfigManager(CallbackHandleMixin):
             env=message.env,
             client_ip=message.request.environ.get("client")[0],
             lut=strftime(message.lut),
-            host_name=message.context['environ'].get('HOSTNAME', 'unknown'),
+            host_name=get_host_name(message),
             client_pid=message.context.get('pid', '--'),
         )
         return data
 
-    def get_connection_clients(self, config_name=None):
-        result, client_list = [], {
-            ws.ws_key: self.format_message_data(message)
-            for ws, message in self._connection_message.items()
-        }
-        for data in client_list.values():
-            if config_name and data['config_name'] != config_name:
-                continue
-            result.append(data)
-        return sorted(result, key=itemgetter('host_name'))
+    def get_connection_clients(self, config_name=None, page=1, limit=10):
+        return [self.format_message_data(message) for _, message in
+                self.connections.page(config_name, page, limit)]
+
+    def validate_parent(self, config_name, parents):
+        if self.dependency_graph.creates_cycle(config_name, parents):
+            raise ProjectDependencyErrorException(config_name=config_name)
+
+    async def start_cluster(self):
+        """
+        Join the change bus of cluster on first request, projects changed by
+        other nodes since startup are indexed again.
+        """
+        if self.store_backend.start_change_bus():
+            self.project_cache.clear()
+            await self.abuild_project_index()
+
+    def set_project_index(self, entries):
+        """
+        Replace indexes by (config_name, data, lut) of all projects.
+        """
+        dependency_graph, project_index = DependencyGraph(), ProjectIndex()
+        for config_name, data, lut in entries:
+            dependency_graph.update(config_name, data.get('parent'))
+            project_index.update(config_name, data, lut)
+        self.dependency_graph, self.project_index = dependency_graph, project_index
+
+    def build_project_index(self):
+        """
+        Index all projects at startup, before requests are served.
+        """
+        backend, entries = self.store_backend, []
+        for config in backend.iter_backend():
+            if isinstance(config, dict):
+                config_name, data, lut = config['config_name'], config['data'], config.get('lut')
+            else:
+                config_name, data, lut = config, backend.load(config), None
+            entries.append((config_name, data, lut or backend.last_modified(config_name)))
+        self.set_project_index(entries)
+
+    async def abuild_project_index(self):
+        backend, entries = self.store_backend, []
+        async for config in backend.aiter_backend():
+            if isinstance(config, dict):
+                config_name, data, lut = config['config_name'], config['data'], config.get('lut')
+            else:
+                config_name, data, lut = config, await backend.aread(config), None
+            if lut is None:
+                lut = await backend.run_sync(backend.last_modified, config_name)
+            entries.append((config_name, data, lut))
+        self.set_project_index(entries)
+
+    async def index_config_project(self, config_name):
+        try:
+            data = await self.store_backend.aread(config_name, check_exist=True)
+        except ProjectNoFoundException:
+            self.dependency_graph.remove(config_name)
+            self.project_index.remove(config_name)
+        else:
+            self.dependency_graph.update(config_name, data.get('parent'))
+            self.project_index.update(config_name, data)
 
     def iter_dependency_config(self, config_name):
-        for config in self.store_backend.iter_backend():
-            parents = config["data"].get('parent') or []
-            if config_name in parents:
-                yield config['config_name']
+        return iter(self.dependency_graph.dependents(config_name))
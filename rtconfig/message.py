@@ -5,6 +5,12 @@ from rtconfig.utils import convert_dt
 
 MT_NO_CHANGE = 'nochange'
 MT_CHANGED = 'changed'
+MT_PATCH = 'patch'
+MT_UNSUBSCRIBE = 'unsubscribe'
+
+FEATURE_PATCH = 'patch'
+FEATURE_ZLIB = 'zlib'
+FEATURE_CONTEXT = 'context'
 
 RESPONSE_MODE_REPLY = 'reply'
 RESPONSE_MODE_NOTIFY = 'notify'
@@ -37,6 +43,10 @@ class Message:
     env = attr.ib(default='default', validator=attr.validators.instance_of(str))
     response_mode = attr.ib(default=RESPONSE_MODE_NOTIFY, validator=attr.validators.instance_of(str))
     lut = attr.ib(default=None, converter=convert_dt)
+    options = attr.ib(default=attr.Factory(dict), validator=attr.validators.instance_of(dict))
+
+    def support(self, feature):
+        return feature in (self.context.get('features') or [])
 
     def get_pull_message(self):
         return json.dumps(dict(
@@ -48,13 +58,23 @@ class Message:
         ))
 
     def get_push_message(self):
-        return json.dumps(dict(
+        message = dict(
             message_type=self.message_type,
             config_name=self.config_name,
             hash_code=self.hash_code,
             data=self.data, env=self.env,
             response_mode=self.response_mode
-        ))
+        )
+        if self.options:
+            message['options'] = self.options
+        return json.dumps(message)
+
+
+def attach_options(push_message, options):
+    """
+    Add options to a serialized push message without dumping its data again.
+    """
+    return '%s, "options": %s}' % (push_message[:-1], json.dumps(options))
 
 
 @attr.s
@@ -0,0 +1,63 @@
+import json
+import datetime
+from rtconfig.utils import strftime
+
+NON_ENV_DOMAINS = ('history', 'parent', 'version')
+
+
+def project_metadata(config_name, source_data, lut=None):
+    envs = {key: value for key, value in source_data.items()
+            if key not in NON_ENV_DOMAINS and isinstance(value, dict)}
+    return dict(
+        config_name=config_name,
+        parent=list(source_data.get('parent') or []),
+        version=source_data.get('version') or 0,
+        envs=sorted(envs),
+        key_num={env: len(data) for env, data in envs.items()},
+        lut=strftime(lut or datetime.datetime.now()),
+        size=len(json.dumps(source_data)),
+    )
+
+
+class ProjectIndex:
+    """
+    Lightweight metadata of all config projects, used for listing
+    without loading project documents.
+    """
+    def __init__(self):
+        self.projects = {}
+        self._names = None
+
+    def __len__(self):
+        return len(self.projects)
+
+    def __contains__(self, config_name):
+        return config_name in self.projects
+
+    def get(self, config_name):
+        return self.projects.get(config_name)
+
+    def update(self, config_name, source_data, lut=None):
+        if config_name not in self.projects:
+            self._names = None
+        self.projects[config_name] = project_metadata(config_name, source_data, lut)
+
+    def remove(self, config_name):
+        if self.projects.pop(config_name, None) is not None:
+            self._names = None
+
+    @property
+    def names(self):
+        if self._names is None:
+            self._names = sorted(self.projects)
+        return self._names
+
+    def search(self, keyword=None, page=1, limit=10):
+        """
+        Return matched project count and metadata of one page.
+        """
+        names = self.names
+        if keyword:
+            names = [name for name in names if keyword in name]
+        offset = (page - 1) * limit
+        return len(names), [self.projects[name] for name in names[offset: offset + limit]]
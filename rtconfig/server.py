@@ -28,6 +28,11 @@ STORE_CONFIG_SCHEME = {
         'session_engine': 'alita_session.mongo',
         'auth_manager_class': MongodbAuthManager
     },
+    'sqlite': {
+        'backend_config_name': 'SQLITE_PATH',
+        'session_engine': 'alita_session.fs',
+        'auth_manager_class': SqliteAuthManager
+    },
 }
 
 
@@ -41,6 +46,14 @@ def _transfer_session_json_file_url(store_path):
     )
 
 
+def _transfer_config_sqlite_url(store_path):
+    return os.path.join(store_path, 'rtconfig.db')
+
+
+def _transfer_session_sqlite_url(store_path):
+    return _transfer_session_json_file_url(store_path)
+
+
 def _transfer_session_redis_url(redis_url):
     redis_url = urlparse(redis_url)
     if redis_url.path:
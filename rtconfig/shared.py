@@ -0,0 +1,91 @@
+import os
+import mmap
+import struct
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_counter = struct.Struct('<Q')
+
+
+class SharedConfig:
+    """
+    Host local config distribution between client processes.
+
+    One process holding the agent lock keeps the websocket connection and
+    publishes config into the snapshot file, then bumps a version counter
+    kept in a memory mapped file. Other processes map the counter read-only
+    and reload the snapshot only when it changes.
+    """
+    def __init__(self, base_path):
+        if fcntl is None:
+            raise RuntimeError('Shared config mode needs fcntl support.')
+        self.lock_path = base_path + '.lock'
+        self.version_path = base_path + '.version'
+        self._lock_fd = None
+        self._version_map = None
+        self.init_version_file()
+
+    @property
+    def is_agent(self):
+        return self._lock_fd is not None
+
+    def init_version_file(self):
+        os.makedirs(os.path.dirname(self.version_path), exist_ok=True)
+        fd = os.open(self.version_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size < _counter.size:
+                os.ftruncate(fd, _counter.size)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def acquire(self):
+        """
+        Try to become the agent of host, never blocks.
+        """
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._lock_fd = fd
+        return True
+
+    def release(self):
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def version(self):
+        if self._version_map is None:
+            with open(self.version_path, 'rb') as f:
+                self._version_map = mmap.mmap(f.fileno(), _counter.size, access=mmap.ACCESS_READ)
+        return _counter.unpack_from(self._version_map, 0)[0]
+
+    def bump(self):
+        fd = os.open(self.version_path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with mmap.mmap(fd, _counter.size) as version_map:
+                version = _counter.unpack_from(version_map, 0)[0] + 1
+                _counter.pack_into(version_map, 0, version)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+        return version
+
+    def close(self):
+        self.release()
+        if self._version_map is not None:
+            self._version_map.close()
+            self._version_map = None
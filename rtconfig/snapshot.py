@@ -0,0 +1,111 @@
+import attr
+from collections import OrderedDict
+from rtconfig.message import Message, MT_CHANGED, MT_PATCH, RESPONSE_MODE_NOTIFY
+from rtconfig.helpers import LRUCache
+from rtconfig.utils import make_patch, HashTree
+
+
+@attr.s
+class Snapshot:
+    """
+    Resolved env data of a config project with its hash code and
+    serialized push messages, shared by all clients with the same key.
+    """
+    config_name = attr.ib()
+    env = attr.ib()
+    data = attr.ib()
+    hash_code = attr.ib()
+    push_messages = attr.ib(default=attr.Factory(dict), repr=False)
+    compressed = attr.ib(default=attr.Factory(dict), repr=False)
+    hash_tree = attr.ib(default=None, repr=False)
+
+    @classmethod
+    def build(cls, config_name, env, data, previous=None):
+        """
+        Hash data reusing key texts of previous HashTree.
+        """
+        hash_tree = HashTree(data, previous)
+        return cls(config_name, env, data, hash_tree.hash_code, hash_tree=hash_tree)
+
+    def get_push_message(self, response_mode=RESPONSE_MODE_NOTIFY):
+        try:
+            return self.push_messages[response_mode]
+        except KeyError:
+            push_message = Message(
+                MT_CHANGED,
+                self.config_name,
+                self.hash_code,
+                self.data,
+                env=self.env,
+                response_mode=response_mode
+            ).get_push_message()
+            self.push_messages[response_mode] = push_message
+            return push_message
+
+    def get_patch_message(self, base_hash, base_tree, response_mode=RESPONSE_MODE_NOTIFY):
+        """
+        Push message with operations from base to this snapshot, fall back
+        to the full payload when the patch is not smaller.
+        """
+        cache_key = (base_hash, response_mode)
+        try:
+            return self.push_messages[cache_key]
+        except KeyError:
+            push_message = Message(
+                MT_PATCH,
+                self.config_name,
+                self.hash_code,
+                dict(base=base_hash, ops=make_patch(
+                    base_tree.data, self.data, base_tree.texts, self.hash_tree.texts)),
+                env=self.env,
+                response_mode=response_mode
+            ).get_push_message()
+            full_message = self.get_push_message(response_mode)
+            if len(push_message) >= len(full_message):
+                push_message = full_message
+            self.push_messages[cache_key] = push_message
+            return push_message
+
+
+class SnapshotStore(LRUCache):
+    """
+    Snapshot cache keyed by (config_name, env, store versions, context variables).
+
+    Hash trees of recent snapshots are also kept by hash code per (config_name, env)
+    and survive invalidation, they are the base of patches pushed to clients
+    and of hashing the next snapshot.
+    """
+    def __init__(self, max_size=1024, history_size=8):
+        super().__init__(max_size)
+        self.history_size = history_size
+        self._history = {}
+        # Template variables referred by (config_name, env, chain versions).
+        self.variables = LRUCache(max_size)
+
+    def remember(self, snapshot):
+        if self.history_size <= 0:
+            return
+        with self._lock:
+            history = self._history.setdefault(
+                (snapshot.config_name, snapshot.env), OrderedDict())
+            history[snapshot.hash_code] = snapshot.hash_tree
+            history.move_to_end(snapshot.hash_code)
+            while len(history) > self.history_size:
+                history.popitem(last=False)
+
+    def get_base(self, config_name, env, hash_code):
+        history = self._history.get((config_name, env))
+        return history.get(hash_code) if history else None
+
+    def latest(self, config_name, env):
+        history = self._history.get((config_name, env))
+        try:
+            return next(reversed(history.values())) if history else None
+        except (StopIteration, RuntimeError):
+            return None
+
+    def invalidate(self, config_name):
+        for cache in (self, self.variables):
+            with cache._lock:
+                for key in [k for k in cache._data if k[0] == config_name]:
+                    del cache._data[key]
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import io
 import os
+import re
 import json
+import string
 import zipfile
 import contextlib
 import tempfile
@@ -12,11 +14,13 @@ import mimetypes
 import subprocess
 import click
 import hashlib
+import operator
 import time
 import datetime
 from decimal import Decimal
-from functools import partial
+from functools import partial, lru_cache
 from collections import defaultdict
+from rtconfig.frozen import FrozenDict, FrozenList
 
 
 class AbortedError(Exception):
@@ -291,9 +295,86 @@ def freeze(o):
     return o
 
 
+def _canonical_default(o):
+    if isinstance(o, (set, frozenset)):
+        return sorted(o)
+    return str(o)
+
+
+_canonical_encoder = json.JSONEncoder(
+    sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=_canonical_default)
+
+if json.encoder.c_make_encoder is not None:
+    # JSONEncoder.encode builds a new C encoder on every call, which costs
+    # more than encoding a small value, so one is built and reused.
+    _iterencode = json.encoder.c_make_encoder(
+        None, _canonical_default, json.encoder.encode_basestring, None,
+        ':', ',', True, False, True)
+
+    def canonical_dumps(o):
+        """
+        Compact json with sorted keys, equal data always gives the same text.
+        """
+        return ''.join(_iterencode(o, 0))
+else:
+    canonical_dumps = _canonical_encoder.encode
+
+
+def _encode_key(key):
+    return json.encoder.encode_basestring(key) if isinstance(key, str) \
+        else canonical_dumps({key: 0})[1:-3]
+
+
+def _hash_text(text):
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).hexdigest()
+
+
+def _hash_value(o):
+    return _hash_text(canonical_dumps(o))
+
+
 def to_hash(*sub, **kw):
-    content = str(freeze([sub, kw])).encode('utf-8', 'ignore')
-    return hashlib.md5(content).hexdigest()[8:-8]
+    return _hash_value([sub, kw])
+
+
+class HashTree:
+    """
+    Hash of the canonical json of a mapping with the canonical json texts
+    of its top level values. Without previous tree the mapping is encoded
+    once and texts are made when first needed. Given the previous tree, a
+    value which is the same object reuses its text, only changed keys are
+    encoded again and the texts are joined to the mapping json.
+    """
+    __slots__ = ('data', 'hash_code', '_texts')
+
+    def __init__(self, data, previous=None):
+        self.data = data
+        if previous is None:
+            self._texts = None
+            self.hash_code = _hash_value(data)
+            return
+        previous_data, previous_texts = previous.data, previous.texts
+        self._texts = texts = {}
+        for key, value in data.items():
+            if key in previous_texts and previous_data[key] is value:
+                texts[key] = previous_texts[key]
+            else:
+                texts[key] = canonical_dumps(value)
+        self.hash_code = _hash_text('{%s}' % ','.join(
+            '%s:%s' % (_encode_key(key), texts[key]) for key in sorted(texts)))
+
+    @property
+    def texts(self):
+        if self._texts is None:
+            self._texts = {key: canonical_dumps(value) for key, value in self.data.items()}
+        return self._texts
+
+
+def hash_data(data):
+    """
+    Hash code of resolved config data, the same on server and client.
+    """
+    return _hash_value(data)
 
 
 def strptime(str_dtime, time_format='%Y-%m-%d %H:%M:%S'):
@@ -327,20 +408,114 @@ def convert_dt(value):
     return value
 
 
-def format_env_data(env_data, **variable):
-    class SafeDict(dict):
-        def __missing__(self, key):
-            return '{' + key + '}'
+class _SafeDict(dict):
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+_formatter = string.Formatter()
+_simple_field_regex = re.compile(r'^[^.\[\]]+$')
+
+
+class Template:
+    """
+    Format string parsed once into literal text and fields, rendered like
+    str.format_map with missing variables kept as they are. Fields with
+    attribute or index lookup fall back to format_map.
+    """
+    __slots__ = ('source', 'parts', 'variables', 'fallback')
+
+    def __init__(self, source):
+        self.source = source
+        self.parts = []
+        self.fallback = False
+        names = set()
+        try:
+            parsed = list(_formatter.parse(source))
+        except ValueError:
+            # Invalid format string, format_map raises the same error.
+            parsed, self.fallback = [], True
+        for literal, field_name, format_spec, conversion in parsed:
+            if literal:
+                self.parts.append(literal)
+            if field_name is None:
+                continue
+            name = re.split(r'[.\[]', field_name, 1)[0]
+            if name and not name.isdigit():
+                names.add(name)
+            if name != field_name or not name or name.isdigit() \
+                    or conversion not in (None, 'r', 's', 'a') or '{' in (format_spec or ''):
+                self.fallback = True
+            self.parts.append((field_name, conversion, format_spec))
+        self.variables = frozenset(names)
+        if not (self.variables or self.fallback):
+            constant = ''.join(self.parts)
+            self.parts = [source if constant == source else constant]
+
+    def render(self, variables):
+        if self.fallback:
+            return self.source.format_map(_SafeDict(variables))
+        if not self.variables:
+            return self.parts[0] if self.parts else ''
+        chunks = []
+        for part in self.parts:
+            if isinstance(part, str):
+                chunks.append(part)
+                continue
+            name, conversion, format_spec = part
+            value = variables[name] if name in variables else '{' + name + '}'
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 's':
+                value = str(value)
+            elif conversion == 'a':
+                value = ascii(value)
+            chunks.append(format(value, format_spec))
+        return ''.join(chunks)
+
+
+@lru_cache(maxsize=65536)
+def compile_template(source):
+    return Template(source)
 
+
+def template_variables(data, names=None):
+    """
+    Names of variables referred by templates in data.
+    """
+    names = set() if names is None else names
+    if isinstance(data, dict):
+        for value in data.values():
+            template_variables(value, names)
+    elif isinstance(data, list):
+        for value in data:
+            template_variables(value, names)
+    elif isinstance(data, str) and '{' in data:
+        names.update(compile_template(data).variables)
+    return names
+
+
+def format_env_data(env_data, **variable):
+    """
+    Render templates of data without modifying it, containers are copied
+    (frozen) only along paths to changed strings, other subtrees are shared.
+    """
     def _convert(data):
         if isinstance(data, dict):
+            changed = {}
             for key, value in data.items():
-                data[key] = _convert(value)
+                new_value = _convert(value)
+                if new_value is not value:
+                    changed[key] = new_value
+            if changed:
+                data = FrozenDict(data)
+                dict.update(data, changed)
         elif isinstance(data, list):
-            for idx, value in enumerate(data):
-                data[idx] = _convert(value)
-        elif isinstance(data, str):
-            data = data.format_map(SafeDict(**variable))
+            values = [_convert(value) for value in data]
+            if any(map(operator.is_not, values, data)):
+                return FrozenList(values)
+        elif isinstance(data, str) and ('{' in data or '}' in data):
+            return compile_template(data).render(variable)
         return data
     return _convert(env_data)
 
@@ -365,3 +540,44 @@ def format_data(data_list):
         return data
 
     return _convert(data_list)
+
+
+def _escape_pointer(key):
+    return '/' + str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _unescape_pointer(path):
+    return path[1:].replace('~1', '/').replace('~0', '~')
+
+
+def make_patch(base, data, base_texts=None, texts=None):
+    """
+    Json-patch style operations turning base into data, compared by top level keys,
+    key texts of HashTree are used if given.
+    """
+    if base_texts is None or texts is None:
+        base_texts, texts = HashTree(base).texts, HashTree(data).texts
+    ops = [dict(op='remove', path=_escape_pointer(key)) for key in base if key not in data]
+    for key, value in data.items():
+        if key not in base:
+            ops.append(dict(op='add', path=_escape_pointer(key), value=value))
+        elif base_texts[key] != texts[key]:
+            ops.append(dict(op='replace', path=_escape_pointer(key), value=value))
+    return ops
+
+
+def apply_patch(data, ops):
+    """
+    Apply operations made by make_patch, return new data and changed keys.
+    """
+    data, changed = dict(data), []
+    for op in ops:
+        key = _unescape_pointer(op['path'])
+        if op['op'] == 'remove':
+            data.pop(key, None)
+        elif op['op'] in ('add', 'replace'):
+            data[key] = op['value']
+        else:
+            raise ValueError('Unsupported patch operation: %s' % op['op'])
+        changed.append(key)
+    return data, changed
@@ -1,5 +1,5 @@
 from rtconfig.exceptions import *
-from rtconfig.helpers import get_json_data, page_result
+from rtconfig.helpers import get_json_data, page_params, page_result
 from alita import Blueprint, render_template, RedirectResponse
 from alita_login import login_required, login_user, logout_user
 from rtconfig.utils import format_data
@@ -11,6 +11,7 @@ page_view.register_error_handler(ProjectExistException, GlobalApiException('配
 page_view.register_error_handler(ProjectNoFoundException, GlobalApiException('配置名称不存在'))
 page_view.register_error_handler(ProjectExtensionInvalidException, GlobalApiException('存储格式不支持'))
 page_view.register_error_handler(ProjectNameErrorException, GlobalApiException('配置项目名称格式不支持'))
+page_view.register_error_handler(ProjectDependencyErrorException, GlobalApiException('配置项目继承关系存在循环'))
 page_view.register_error_handler(ConfigVersionException, GlobalApiException('配置项目版本已更改，无法执行修改。'))
 page_view.register_error_handler(ProjectEnvErrorException, lambda r, e: GlobalApiException(
     '配置项{%s}名称或配置值错误' % e.options.get('env') or ''))
@@ -58,8 +59,11 @@ async def page_config_clients(request):
 @login_required
 async def page_config_detail(request):
     config_name = request.args['config_name']
+    config_project = await request.config_manager.load_config_project(
+        config_name, check_exist=True)
     return await render_template(
         request, 'detail.html', config_name=config_name,
+        version=config_project.version
     )
 
 
@@ -68,7 +72,7 @@ async def page_config_detail(request):
 async def page_system_info(request):
     return await render_template(
         request, 'system.html',
-        client_info=request.config_manager.client_info,
+        client_info=await request.config_manager.get_client_info(),
         system_info=request.config_manager.system_info,
     )
 
@@ -129,7 +133,10 @@ async def user_token(request):
 @api_view.route('/config/list')
 @login_required
 async def config_list(request):
-    return page_result(request, request.config_manager.get_config_project_list())
+    page, limit = page_params(request)
+    count, data = request.config_manager.get_config_project_list(
+        request.args.get('keyword'), page, limit)
+    return page_result(request, data, count=count)
 
 
 @api_view.route('/config', methods=['GET', 'POST', 'PUT', 'DELETE'])
@@ -145,9 +152,12 @@ async def config_detail(request):
         )
     elif request.method == "PUT":
         env = request.args.get('env')
+        version = request.args.get('version')
         data = get_json_data(request)
         if not isinstance(data, dict):
             raise GlobalApiException('配置数据必须为字典')
+        if not env:
+            version = data.pop('version', version)
         if not data:
             raise GlobalApiException('配置数据不能为空')
         if env:
@@ -157,13 +167,13 @@ async def config_detail(request):
                 value=value
             ) for key, value in data.items()}
         await config_manager.update_config_project(
-            request, config_name, data, env)
+            request, config_name, data, env, version)
     elif request.method == "DELETE":
         await config_manager.remove_config_project(config_name)
         return {'code': 0, "data": {}}
     return {
         'code': 0,
-        "data": config_manager.get_config_project_info(config_name)
+        "data": await config_manager.get_config_project_info(config_name)
     }
 
 
@@ -172,8 +182,8 @@ async def config_detail(request):
 async def config_export(request):
     config_name = request.args['config_name']
     config_manager = request.config_manager
-    config_data = config_manager.get_config_project_info(
-        config_name)['source_data'].get('default') or {}
+    config_data = (await config_manager.get_config_project_info(
+        config_name))['source_data'].get('default') or {}
     return {
         'code': 0,
         "data": {k: v['value'] for k, v in config_data.items()}
@@ -187,15 +197,12 @@ async def update_config_detail(request):
     env = request.args['env']
     config_manager = request.config_manager
     if request.method == 'GET':
-        config_project = config_manager.get_config_project(config_name)
+        config_project = await config_manager.load_config_project(config_name)
         env_data = config_project.source_data.get(env) or {}
-        history_data = config_project.source_data.get('history') or {}
-        env_history_data = history_data.get(env) or {}
-        data = list(env_data.values())
-        for i in data:
-            i['history'] = env_history_data.get(i['key']) or []
-        return page_result(request, list(env_data.values()))
+        return dict(page_result(request, list(env_data.values())),
+                    version=config_project.version)
     key = request.json.get('key')
+    version = request.json.get('version')
     if not (key and config_manager.validate_name(key)):
         raise GlobalApiException('配置项名称为空或有误')
     if request.method in ["POST", "PUT"]:
@@ -203,24 +210,44 @@ async def update_config_detail(request):
         desc = request.json.get('desc')
         if value is None:
             raise GlobalApiException('配置值不能为空')
-        if request.method == "POST" and config_manager.env_key_exist(
+        if request.method == "POST" and await config_manager.env_key_exist(
                 config_name, env, key):
             raise GlobalApiException(f'配置项[{key}]已存在')
-        await config_manager.add_env_config(
+        config_project = await config_manager.add_env_config(
             request, config_name, env, {
                 key: dict(
                     key=key,
                     desc=desc,
                     value=value
-                )}
+                )}, version
             )
-    elif request.method == "DELETE":
-        await config_manager.remove_env_config(config_name, env, [key])
-    return {'code': 0, "data": {}}
+    else:
+        config_project = await config_manager.remove_env_config(
+            config_name, env, [key], version)
+    return {'code': 0, "data": {'version': config_project.version}}
+
+
+@api_view.route('/config/history', methods=['GET'])
+@login_required
+async def config_history(request):
+    page, limit = page_params(request)
+    count, data = await request.config_manager.get_config_history(
+        request.args['config_name'],
+        env=request.args.get('env') or None,
+        key=request.args.get('key') or None,
+        page=page, limit=limit
+    )
+    return page_result(request, data, count)
 
 
 @api_view.route('/client')
 @login_required
 async def api_config_client(request):
-    config_name = request.args.get('config_name')
-    return page_result(request, request.config_manager.get_connection_clients(config_name))
+    config_name = request.args.get('config_name') or None
+    page, limit = page_params(request)
+    config_manager = request.config_manager
+    return page_result(
+        request,
+        config_manager.get_connection_clients(config_name, page, limit),
+        count=config_manager.connection_num(config_name)
+    )